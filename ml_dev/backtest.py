@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import dask.array as da
+import numpy as np
+import torch
+import xarray as xr
+
+# python backtest.py [model.pt], with the model made by create_torchscript.py
+DATA_PATH = os.environ.get("DATA_PATH", "data/ndvi_processed.zarr")
+OUTPUT_PATH = os.environ.get("BACKTEST_OUTPUT_PATH", "data/backtest.zarr")
+NUM_PAST_STEPS = 10
+NUM_FUTURE_STEPS = 3
+# Forecasts are made at the last BACKTEST_ORIGINS time steps that have a full future
+NUM_ORIGINS = int(os.environ.get("BACKTEST_ORIGINS", 46))
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", 65536))
+# Pixels of a block are forecast at every origin, the next block is read meanwhile
+BLOCK_SIZE = int(os.environ.get("BACKTEST_BLOCK_SIZE", 500))
+
+
+def forecast_windows(model, windows, batch_size=BATCH_SIZE):
+    """Forecast (windows, past steps) in batches, normalized by the past like training."""
+    result = np.empty((len(windows), NUM_FUTURE_STEPS), dtype=np.float32)
+    with torch.inference_mode():
+        for start in range(0, len(windows), batch_size):
+            past_steps = torch.from_numpy(windows[start : start + batch_size, :, None])
+            mean = past_steps.mean(dim=1, keepdim=True)
+            std = past_steps.std(dim=1, keepdim=True)
+            output = model((past_steps - mean) / (std + 1e-12))
+            result[start : start + len(past_steps)] = (
+                (output * std + mean).squeeze(-1).numpy()
+            )
+    return result
+
+
+def block_errors(model, values):
+    """Forecast errors of (time, pixels) values at every origin.
+
+    Returns (origin, pixel, horizon) errors, NaN where a window has missing values.
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(
+        values, NUM_PAST_STEPS + NUM_FUTURE_STEPS, axis=0
+    )  # (origin, pixel, step)
+    windows = windows.reshape(-1, windows.shape[-1])
+    valid = ~np.isnan(windows).any(axis=1)
+    errors = np.full((len(windows), NUM_FUTURE_STEPS), np.nan, dtype=np.float32)
+    if valid.any():
+        past = np.ascontiguousarray(windows[valid, :NUM_PAST_STEPS])
+        future = windows[valid, NUM_PAST_STEPS:]
+        errors[valid] = forecast_windows(model, past) - future
+    return errors.reshape(-1, values.shape[1], NUM_FUTURE_STEPS), int(valid.sum())
+
+
+def error_maps(errors):
+    """MAE, RMSE and number of forecasts of (origin, pixel, horizon) errors."""
+    count = np.sum(~np.isnan(errors), axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mae = np.nansum(np.abs(errors), axis=0) / count
+        rmse = np.sqrt(np.nansum(errors**2, axis=0) / count)
+    return mae.astype(np.float32), rmse.astype(np.float32), count.astype(np.int32)
+
+
+def blocks(height, width, block_size=BLOCK_SIZE):
+    for y in range(0, height, block_size):
+        for x in range(0, width, block_size):
+            yield (
+                slice(y, min(y + block_size, height)),
+                slice(x, min(x + block_size, width)),
+            )
+
+
+def create_output(ndvi, path, block_size=BLOCK_SIZE):
+    """Empty (horizon, y, x) error maps in path, chunked like the blocks."""
+    shape = (NUM_FUTURE_STEPS, ndvi.sizes["y"], ndvi.sizes["x"])
+    chunks = (NUM_FUTURE_STEPS, block_size, block_size)
+    dims = ("horizon", "y", "x")
+    ds = xr.Dataset(
+        {
+            "mae": (dims, da.full(shape, np.nan, dtype=np.float32, chunks=chunks)),
+            "rmse": (dims, da.full(shape, np.nan, dtype=np.float32, chunks=chunks)),
+            "num_forecasts": (dims, da.zeros(shape, dtype=np.int32, chunks=chunks)),
+        },
+        coords={
+            "horizon": np.arange(1, NUM_FUTURE_STEPS + 1),
+            "y": ndvi.y,
+            "x": ndvi.x,
+        },
+    )
+    # The first forecast date of each origin
+    num_origins = ndvi.sizes["time"] - NUM_PAST_STEPS - NUM_FUTURE_STEPS + 1
+    origins = ndvi.time.values[NUM_PAST_STEPS : NUM_PAST_STEPS + num_origins]
+    ds.attrs["origins"] = [str(np.datetime_as_string(t, unit="D")) for t in origins]
+    ds.to_zarr(path, mode="w", compute=False)
+
+
+def backtest(model, ndvi, output_path=OUTPUT_PATH, block_size=BLOCK_SIZE):
+    """Write the error maps of model at the origins of ndvi to output_path.
+
+    Returns the total MAE and RMSE by horizon and the number of forecasts.
+    """
+    create_output(ndvi, output_path, block_size)
+    total_abs = np.zeros(NUM_FUTURE_STEPS)
+    total_sq = np.zeros(NUM_FUTURE_STEPS)
+    total_count = np.zeros(NUM_FUTURE_STEPS, dtype=np.int64)
+    num_windows = 0
+    model_seconds = 0.0
+
+    def load(block):
+        values = ndvi.isel(y=block[0], x=block[1]).values.astype(np.float32)
+        return block, values.reshape(values.shape[0], -1)
+
+    with ThreadPoolExecutor(1) as executor:
+        todo = list(blocks(ndvi.sizes["y"], ndvi.sizes["x"], block_size))
+        future = executor.submit(load, todo[0])
+        for i in range(len(todo)):
+            block, values = future.result()
+            if i + 1 < len(todo):
+                future = executor.submit(load, todo[i + 1])
+            start = time.perf_counter()
+            errors, valid = block_errors(model, values)
+            model_seconds += time.perf_counter() - start
+            num_windows += valid
+            total_abs += np.nansum(np.abs(errors), axis=(0, 1))
+            total_sq += np.nansum(errors**2, axis=(0, 1))
+            total_count += np.sum(~np.isnan(errors), axis=(0, 1))
+
+            shape = (block[0].stop - block[0].start, block[1].stop - block[1].start)
+            maps = {
+                name: (("horizon", "y", "x"), m.T.reshape(NUM_FUTURE_STEPS, *shape))
+                for name, m in zip(("mae", "rmse", "num_forecasts"), error_maps(errors))
+            }
+            xr.Dataset(maps).to_zarr(
+                output_path,
+                region={"horizon": slice(None), "y": block[0], "x": block[1]},
+            )
+    return (
+        total_abs / total_count,
+        np.sqrt(total_sq / total_count),
+        num_windows,
+        model_seconds,
+    )
+
+
+def main(model_path="model.pt"):
+    model = torch.jit.load(model_path, map_location="cpu")
+    model.eval()
+    ndvi = xr.open_zarr(DATA_PATH)["ndvi_8d_processed"].transpose("time", "y", "x")
+    window_size = NUM_PAST_STEPS + NUM_FUTURE_STEPS
+    ndvi = ndvi.isel(time=slice(-(NUM_ORIGINS + window_size - 1), None))
+    num_origins = ndvi.sizes["time"] - window_size + 1
+    num_pixels = ndvi.sizes["y"] * ndvi.sizes["x"]
+    print(f"Backtesting {model_path} at {num_origins} origins of {num_pixels} pixels.")
+
+    start = time.perf_counter()
+    mae, rmse, num_windows, model_seconds = backtest(model, ndvi)
+    seconds = time.perf_counter() - start
+    for horizon in range(NUM_FUTURE_STEPS):
+        print(
+            f"Horizon {horizon + 1}: MAE {mae[horizon]:.4f}, RMSE {rmse[horizon]:.4f}"
+        )
+    print(
+        f"Forecast {num_windows} windows in {seconds:.1f} s "
+        f"({num_windows / seconds:.0f} windows/s, model {model_seconds:.1f} s, "
+        f"{torch.get_num_threads()} threads). Error maps written to {OUTPUT_PATH}."
+    )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -11,4 +11,17 @@ model = AutoregressionTask.load_from_checkpoint(
 
 example_past = torch.randn(1, num_past_steps, input_size)
 
-model.to_torchscript(method="trace", example_inputs=example_past, file_path="model.pt")
\ No newline at end of file
+model.to_torchscript(method="trace", example_inputs=example_past, file_path="model.pt")
+
+# Alternative inference backends, selected with INFERENCE_BACKEND in ml_inference
+quantized = torch.ao.quantization.quantize_dynamic(
+    model.eval(), {torch.nn.LSTM, torch.nn.Linear}, dtype=torch.qint8)
+torch.jit.trace(quantized, example_past).save("model_int8.pt")
+
+model.to_onnx(
+    "model.onnx",
+    example_past,
+    input_names=["past_steps"],
+    output_names=["forecast"],
+    dynamic_axes={"past_steps": {0: "batch", 1: "time"}, "forecast": {0: "batch"}},
+    dynamo=False)
@@ -1,12 +1,25 @@
 from typing import Any
 
+import xarray as xr
 from lightning.pytorch import LightningDataModule
 from torch.utils.data import DataLoader, Subset
 
-from .ndvi_dataset import NDVIDataset
+from .ndvi_dataset import NDVIDataset, collate_batch
+from .ndvi_stream_dataset import NDVIStreamDataset
+from .window_cache import cached_dataset
 
 
 class NDVIDataModule(LightningDataModule):
+    """NDVI windows split by time into train, validation and test sets.
+
+    With streaming, windows of every pixel are streamed from the store instead of
+    loading num_locations pixels into memory. Each split then has its own time range,
+    so no window of one split has a time step of another.
+
+    With a cache_dir, the samples are written once to a window cache and memory-mapped
+    by later runs with the same store and arguments.
+    """
+
     def __init__(
         self,
         data_dir: str,
@@ -14,6 +27,9 @@ class NDVIDataModule(LightningDataModule):
         val_split_pct: float = 0.2,
         test_split_pct: float = 0.2,
         num_workers: int = 0,
+        streaming: bool = False,
+        buffer_size: int = 1_000_000,
+        cache_dir: str | None = None,
         **kwargs: Any,
     ) -> None:
         super().__init__()
@@ -22,10 +38,19 @@ class NDVIDataModule(LightningDataModule):
         self.val_split_pct = val_split_pct
         self.test_split_pct = test_split_pct
         self.num_workers = num_workers
+        self.streaming = streaming
+        self.buffer_size = buffer_size
+        self.cache_dir = cache_dir
         self.kwargs = kwargs
 
     def setup(self, stage):
-        dataset = NDVIDataset(root=self.data_dir, **self.kwargs)
+        if self.streaming:
+            self.setup_streaming()
+            return
+        if self.cache_dir is not None:
+            dataset = cached_dataset(self.data_dir, self.cache_dir, **self.kwargs)
+        else:
+            dataset = NDVIDataset(root=self.data_dir, **self.kwargs)
         train_split_pct = 1 - (self.val_split_pct + self.test_split_pct)
         train_size = int(train_split_pct * len(dataset))
         val_size = int(self.val_split_pct * len(dataset))
@@ -36,11 +61,53 @@ class NDVIDataModule(LightningDataModule):
         self.val_dataset = Subset(dataset, val_indices)
         self.test_dataset = Subset(dataset, test_indices)
 
+    def setup_streaming(self):
+        kwargs = {k: v for k, v in self.kwargs.items() if k != "num_locations"}
+        store = f"{self.data_dir}/{NDVIStreamDataset.data_file_name}"
+        num_times = xr.open_zarr(store).sizes["time"]
+        train_size = int((1 - (self.val_split_pct + self.test_split_pct)) * num_times)
+        val_size = int(self.val_split_pct * num_times)
+        time_ranges = {
+            "train": (0, train_size),
+            "val": (train_size, train_size + val_size),
+            "test": (train_size + val_size, num_times),
+        }
+        self.train_dataset, self.val_dataset, self.test_dataset = (
+            NDVIStreamDataset(
+                root=self.data_dir,
+                time_range=time_ranges[split],
+                batch_size=self.batch_size,
+                shuffle=split == "train",
+                buffer_size=self.buffer_size,
+                **kwargs,
+            )
+            for split in ("train", "val", "test")
+        )
+
+    def dataloader(self, dataset, shuffle=False):
+        if self.streaming:
+            # The dataset yields whole batches and shuffles them itself. Zarr can't be
+            # used in forked workers, so they are spawned once and kept between epochs.
+            return DataLoader(
+                dataset,
+                batch_size=None,
+                num_workers=self.num_workers,
+                multiprocessing_context="spawn" if self.num_workers else None,
+                persistent_workers=self.num_workers > 0,
+            )
+        return DataLoader(
+            dataset,
+            batch_size=self.batch_size,
+            shuffle=shuffle,
+            num_workers=self.num_workers,
+            collate_fn=collate_batch,
+        )
+
     def train_dataloader(self):
-        return DataLoader(self.train_dataset, batch_size=self.batch_size, shuffle=True)
+        return self.dataloader(self.train_dataset, shuffle=True)
 
     def val_dataloader(self):
-        return DataLoader(self.val_dataset, batch_size=self.batch_size)
+        return self.dataloader(self.val_dataset)
 
     def test_dataloader(self):
-        return DataLoader(self.test_dataset, batch_size=self.batch_size)
+        return self.dataloader(self.test_dataset)
@@ -1,4 +1,5 @@
 import os
+from collections.abc import Sequence
 from typing import Any
 
 import numpy as np
@@ -7,6 +8,27 @@ import xarray as xr
 from torch.utils.data import Dataset
 
 
+def normalize_windows(windows: torch.Tensor, num_past_steps: int) -> dict[str, Any]:
+    """Split (batch, window) windows into past and future steps normalized by the past."""
+    windows = windows.unsqueeze(-1)
+    past_steps = windows[:, :num_past_steps]
+    future_steps = windows[:, num_past_steps:]
+
+    mean = past_steps.mean(dim=1, keepdim=True)
+    std = past_steps.std(dim=1, keepdim=True)
+    return {
+        "past_targets": (past_steps - mean) / (std + 1e-12),
+        "future_targets": (future_steps - mean) / (std + 1e-12),
+        "mean": mean,
+        "std": std,
+    }
+
+
+def collate_batch(batch: dict[str, Any]) -> dict[str, Any]:
+    """Batches from NDVIDataset.__getitems__ are already collated."""
+    return batch
+
+
 class NDVIDataset(Dataset):
     data_file_name = "ndvi_processed.zarr"
 
@@ -16,15 +38,21 @@ class NDVIDataset(Dataset):
         num_past_steps: int = 3,
         num_future_steps: int = 1,
         num_locations: int = 100,
+        seed: int = 0,
     ) -> None:
         self.root = root
         self.num_past_steps = num_past_steps
         self.num_future_steps = num_future_steps
         self.num_locations = num_locations
+        self.seed = seed
 
-        self.data = self._load_data()
+        # (time, location) values, every window is a strided view into them
+        self.data = np.ascontiguousarray(self._load_data().values, dtype=np.float32)
         self.window_size = num_past_steps + num_future_steps
         self.T, self.Z = self.data.shape
+        self.windows = np.lib.stride_tricks.sliding_window_view(
+            self.data, self.window_size, axis=0
+        )
 
         self.num_time = self.T - self.window_size + 1
         self.total = self.num_time * self.Z
@@ -33,50 +61,31 @@ class NDVIDataset(Dataset):
         return self.total
 
     def __getitem__(self, index: int) -> dict[str, Any]:
-        time_idx = index // self.Z
-        z_idx = index % self.Z
+        batch = self.__getitems__([index])
+        return {key: value[0] for key, value in batch.items()}
 
-        past_steps = self.data.isel(
-            z=z_idx, time=slice(time_idx, time_idx + self.num_past_steps)
-        )
-        future_steps = self.data.isel(
-            z=z_idx,
-            time=slice(
-                time_idx + self.num_past_steps,
-                time_idx + self.window_size,
-            ),
-        )
+    def __getitems__(self, indices: Sequence[int]) -> dict[str, Any]:
+        """Normalized samples for a batch of indices, stacked along the first dimension.
 
-        past_steps_tensor: torch.Tensor = torch.tensor(
-            past_steps.values, dtype=torch.float32
-        ).unsqueeze(-1)
-        future_steps_tensor: torch.Tensor = torch.tensor(
-            future_steps.values, dtype=torch.float32
-        ).unsqueeze(-1)
-
-        mean = past_steps_tensor.mean(dim=0, keepdim=True)
-        std = past_steps_tensor.std(dim=0, keepdim=True)
-        past_steps_normalized = (past_steps_tensor - mean) / (std + 1e-12)
-        future_steps_normalized = (future_steps_tensor - mean) / (std + 1e-12)
-
-        return {
-            "past_targets": past_steps_normalized,
-            "future_targets": future_steps_normalized,
-            "mean": mean,
-            "std": std,
-        }
+        Used by DataLoader with collate_batch instead of __getitem__ for every index.
+        """
+        indices = np.asarray(indices)
+        time_idx = indices // self.Z
+        z_idx = indices % self.Z
+        windows = torch.from_numpy(self.windows[time_idx, z_idx])
+        return normalize_windows(windows, self.num_past_steps)
 
     def _load_data(self) -> xr.DataArray:
         pathname = os.path.join(self.root, self.data_file_name)
         if os.path.exists(pathname):
             data = xr.open_zarr(pathname)
             flat = data.stack(z=("x", "y"))
-            rng = np.random.default_rng(seed=0)  # fixed seed for reproducibility
+            rng = np.random.default_rng(seed=self.seed)  # fixed for reproducibility
             sample_indices = rng.choice(
                 flat.z.size, size=self.num_locations, replace=False
             )
             sampled = flat.isel(z=sample_indices)
             ndvi = sampled["ndvi_8d_processed"]
-            return ndvi.compute()
+            return ndvi.transpose("time", "z").compute()
         else:
             raise FileNotFoundError
@@ -0,0 +1,125 @@
+import os
+from collections.abc import Iterator
+from typing import Any
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import xarray as xr
+from torch.utils.data import IterableDataset, get_worker_info
+
+from .ndvi_dataset import normalize_windows
+
+
+class NDVIStreamDataset(IterableDataset):
+    """Windows of every pixel in a time range of the store, streamed block by block.
+
+    The store is read in blocks of whole spatial chunks over the time range, so only a
+    few blocks are in memory at once. Blocks are split between DataLoader workers and
+    distributed ranks, and windows are shuffled through a buffer of buffer_size
+    windows. Yields normalized batches, so use it with DataLoader(batch_size=None).
+    Ranks can get a different number of batches, so limit the batches of an epoch
+    when training on several GPUs, e.g. with Trainer(limit_train_batches=...).
+    """
+
+    data_file_name = "ndvi_processed.zarr"
+
+    def __init__(
+        self,
+        root: str = "data",
+        num_past_steps: int = 3,
+        num_future_steps: int = 1,
+        time_range: tuple[int, int] | None = None,
+        batch_size: int = 64,
+        shuffle: bool = False,
+        buffer_size: int = 1_000_000,
+        block_chunks: int = 1,
+    ) -> None:
+        self.root = root
+        self.num_past_steps = num_past_steps
+        self.num_future_steps = num_future_steps
+        self.window_size = num_past_steps + num_future_steps
+        self.time_range = time_range
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.buffer_size = buffer_size
+        self.epoch = 0
+
+        ndvi = self._open_data()
+        chunks = dict(zip(ndvi.dims, ndvi.encoding["chunks"]))
+        self.blocks = [
+            (
+                slice(y, y + chunks["y"] * block_chunks),
+                slice(x, x + chunks["x"] * block_chunks),
+            )
+            for y in range(0, ndvi.sizes["y"], chunks["y"] * block_chunks)
+            for x in range(0, ndvi.sizes["x"], chunks["x"] * block_chunks)
+        ]
+
+    def _open_data(self) -> xr.DataArray:
+        pathname = os.path.join(self.root, self.data_file_name)
+        if not os.path.exists(pathname):
+            raise FileNotFoundError
+        ndvi = xr.open_zarr(pathname)["ndvi_8d_processed"].transpose("time", "y", "x")
+        if self.time_range is not None:
+            ndvi = ndvi.isel(time=slice(*self.time_range))
+        return ndvi
+
+    def _shard_blocks(self) -> list[tuple[slice, slice]]:
+        """The blocks of this worker on this rank."""
+        rank, world_size = 0, 1
+        if dist.is_available() and dist.is_initialized():
+            rank, world_size = dist.get_rank(), dist.get_world_size()
+        worker = get_worker_info()
+        worker_id, num_workers = (
+            (0, 1) if worker is None else (worker.id, worker.num_workers)
+        )
+        shard = rank * num_workers + worker_id
+        return self.blocks[shard :: world_size * num_workers]
+
+    def _block_windows(
+        self, ndvi: xr.DataArray, block: tuple[slice, slice]
+    ) -> np.ndarray:
+        """(window, step) windows of every pixel in the block, without missing values."""
+        values = ndvi.isel(y=block[0], x=block[1]).values.astype(np.float32)
+        values = values.reshape(values.shape[0], -1)
+        windows = np.lib.stride_tricks.sliding_window_view(
+            values, self.window_size, axis=0
+        ).reshape(-1, self.window_size)
+        return windows[~np.isnan(windows).any(axis=1)]
+
+    def _batches(self, windows: np.ndarray, final: bool) -> Iterator[dict[str, Any]]:
+        end = len(windows) if final else len(windows) - len(windows) % self.batch_size
+        for start in range(0, end, self.batch_size):
+            batch = torch.from_numpy(windows[start : start + self.batch_size])
+            yield normalize_windows(batch, self.num_past_steps)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        ndvi = self._open_data()
+        # Differs between workers and epochs, the blocks of each worker don't
+        rng = np.random.default_rng([torch.initial_seed(), self.epoch])
+        self.epoch += 1
+        blocks = self._shard_blocks()
+        if self.shuffle:
+            blocks = [blocks[i] for i in rng.permutation(len(blocks))]
+
+        buffer = []
+        buffered = 0
+        for block in blocks:
+            windows = self._block_windows(ndvi, block)
+            buffer.append(windows)
+            buffered += len(windows)
+            if buffered >= self.buffer_size:
+                windows = np.concatenate(buffer)
+                if self.shuffle:
+                    windows = windows[rng.permutation(len(windows))]
+                yield from self._batches(windows, final=False)
+                # The windows left over from the last full batch stay in the buffer
+                remainder = len(windows) % self.batch_size
+                buffer = [windows[len(windows) - remainder :]] if remainder else []
+                buffered = remainder
+        if buffer:
+            windows = np.concatenate(buffer)
+            if self.shuffle:
+                windows = windows[rng.permutation(len(windows))]
+            yield from self._batches(windows, final=True)
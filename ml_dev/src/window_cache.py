@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections.abc import Sequence
+from typing import Any
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from .ndvi_dataset import NDVIDataset
+
+FIELDS = ("past_targets", "future_targets", "mean", "std")
+# Samples per shard, a shard of 10 past and 3 future steps is about 64 MB
+SHARD_SIZE = 2**20
+
+
+def store_fingerprint(pathname: str) -> str:
+    """Digest of the path, size and modification time of every file in a Zarr store.
+
+    Any write to the store changes it, without reading the chunks.
+    """
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(pathname):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            stat = os.stat(path)
+            relpath = os.path.relpath(path, pathname)
+            digest.update(f"{relpath}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def cache_key(
+    root: str,
+    num_past_steps: int = 3,
+    num_future_steps: int = 1,
+    num_locations: int = 100,
+    seed: int = 0,
+) -> str:
+    """Fingerprint of the samples NDVIDataset would make with these arguments."""
+    params = {
+        "store": store_fingerprint(os.path.join(root, NDVIDataset.data_file_name)),
+        "num_past_steps": num_past_steps,
+        "num_future_steps": num_future_steps,
+        "num_locations": num_locations,
+        "seed": seed,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def write_window_cache(
+    dataset: NDVIDataset, path: str, shard_size: int = SHARD_SIZE
+) -> None:
+    """Write the normalized samples of dataset to .npy shards in path.
+
+    Shards are written to a temporary directory that is renamed to path when done, so
+    an interrupted or concurrent run never leaves a partial cache behind.
+    """
+    parent = os.path.dirname(path) or "."
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        num_shards = 0
+        for start in range(0, len(dataset), shard_size):
+            indices = range(start, min(start + shard_size, len(dataset)))
+            batch = dataset.__getitems__(indices)
+            for field in FIELDS:
+                np.save(
+                    os.path.join(tmp, f"{field}.{num_shards:05d}.npy"),
+                    batch[field].numpy(),
+                )
+            num_shards += 1
+        meta = {"length": len(dataset), "shard_size": shard_size, "shards": num_shards}
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        os.rename(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        # Another run wrote the same cache first
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            raise
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+class CachedNDVIDataset(Dataset):
+    """The samples of NDVIDataset, memory-mapped from a window cache.
+
+    Indices are the same as those of NDVIDataset. Pages of the shards are shared by
+    DataLoader workers and later runs through the page cache.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.total = meta["length"]
+        self.shard_size = meta["shard_size"]
+        self.shards = [
+            {
+                field: np.load(
+                    os.path.join(path, f"{field}.{i:05d}.npy"), mmap_mode="r"
+                )
+                for field in FIELDS
+            }
+            for i in range(meta["shards"])
+        ]
+
+    def __len__(self) -> int:
+        return self.total
+
+    def __getitem__(self, index: int) -> dict[str, Any]:
+        batch = self.__getitems__([index])
+        return {key: value[0] for key, value in batch.items()}
+
+    def __getitems__(self, indices: Sequence[int]) -> dict[str, Any]:
+        indices = np.asarray(indices)
+        shard_idx = indices // self.shard_size
+        offsets = indices % self.shard_size
+        batch = {}
+        for field in FIELDS:
+            shape = (len(indices), *self.shards[0][field].shape[1:])
+            values = np.empty(shape, dtype=np.float32)
+            for shard in np.unique(shard_idx):
+                mask = shard_idx == shard
+                values[mask] = self.shards[shard][field][offsets[mask]]
+            batch[field] = torch.from_numpy(values)
+        return batch
+
+
+def cached_dataset(
+    root: str = "data", cache_dir: str = "cache", **kwargs: Any
+) -> CachedNDVIDataset:
+    """CachedNDVIDataset of the NDVIDataset(root, **kwargs) samples.
+
+    The cache is written on first use and reused while the store and arguments are
+    unchanged.
+    """
+    path = os.path.join(cache_dir, cache_key(root, **kwargs))
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        print(f"Writing window cache {path}")
+        write_window_cache(NDVIDataset(root=root, **kwargs), path)
+    return CachedNDVIDataset(path)
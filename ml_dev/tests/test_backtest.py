@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import torch
+import xarray as xr
+
+from backtest import NUM_FUTURE_STEPS, NUM_PAST_STEPS, backtest
+
+
+class LastValueModel(torch.nn.Module):
+    """Forecasts the last past step at every horizon."""
+
+    def forward(self, past_steps):
+        return past_steps[:, -1:, :].repeat(1, NUM_FUTURE_STEPS, 1)
+
+
+def test_backtest_errors(tmp_path):
+    num_origins = 3
+    num_time = NUM_PAST_STEPS + NUM_FUTURE_STEPS + num_origins - 1
+    values = np.random.default_rng(0).random((num_time, 3, 4)).astype(np.float32)
+    values[-1, 2, 3] = np.nan
+    ndvi = xr.DataArray(
+        values,
+        dims=("time", "y", "x"),
+        coords={
+            "time": pd.date_range("2024-01-01", periods=num_time, freq="8D"),
+            "y": np.arange(3.0),
+            "x": np.arange(4.0),
+        },
+    )
+    model = torch.jit.trace(LastValueModel(), torch.zeros(1, NUM_PAST_STEPS, 1))
+
+    output_path = str(tmp_path / "backtest.zarr")
+    mae, rmse, num_windows, _ = backtest(model, ndvi, output_path, block_size=2)
+
+    # (origin, horizon, y, x) errors of forecasting the last past value
+    errors = np.stack(
+        [
+            values[o + NUM_PAST_STEPS - 1]
+            - values[o + NUM_PAST_STEPS : o + NUM_PAST_STEPS + NUM_FUTURE_STEPS]
+            for o in range(num_origins)
+        ]
+    )
+    # The window of the last origin with the missing value has no forecast
+    errors[-1, :, 2, 3] = np.nan
+    assert num_windows == num_origins * 12 - 1
+    np.testing.assert_allclose(mae, np.nanmean(np.abs(errors), axis=(0, 2, 3)), 1e-5)
+    np.testing.assert_allclose(
+        rmse, np.sqrt(np.nanmean(errors**2, axis=(0, 2, 3))), 1e-5
+    )
+    maps = xr.open_zarr(output_path)
+    assert maps.attrs["origins"] == ["2024-03-21", "2024-03-29", "2024-04-06"]
+    np.testing.assert_allclose(maps.mae, np.nanmean(np.abs(errors), axis=0), 1e-5)
+    np.testing.assert_allclose(maps.rmse, np.sqrt(np.nanmean(errors**2, axis=0)), 1e-5)
+    np.testing.assert_array_equal(maps.num_forecasts, np.sum(~np.isnan(errors), axis=0))
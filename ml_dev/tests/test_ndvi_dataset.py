@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+import xarray as xr
+from torch.utils.data import DataLoader
+
+from src.ndvi_dataset import NDVIDataset, collate_batch, normalize_windows
+
+
+@pytest.fixture
+def root(tmp_path):
+    rng = np.random.default_rng(0)
+    values = rng.random((8, 3, 4))
+    values[2, 1, 1] = np.nan
+    values[7, 0, 3] = np.nan
+    ndvi = xr.DataArray(
+        values,
+        dims=("time", "y", "x"),
+        coords={
+            "time": pd.date_range("2024-01-01", periods=8, freq="8D"),
+            "y": np.arange(3.0),
+            "x": np.arange(4.0),
+        },
+    )
+    xr.Dataset({"ndvi_8d_processed": ndvi}).to_zarr(
+        tmp_path / "ndvi_processed.zarr", mode="w"
+    )
+    return str(tmp_path)
+
+
+@pytest.fixture
+def dataset(root):
+    return NDVIDataset(root, num_past_steps=3, num_future_steps=2, num_locations=12)
+
+
+def test_batches_match_samples(dataset):
+    assert len(dataset) == 4 * 12
+    # The first and last location of the first and last time, and windows with NaN
+    indices = [0, 11, 36, 47, 5, 13, 40]
+
+    batch = dataset.__getitems__(indices)
+    samples = [dataset[i] for i in indices]
+
+    for key, value in batch.items():
+        expected = torch.stack([sample[key] for sample in samples])
+        torch.testing.assert_close(value, expected, equal_nan=True)
+
+
+def test_samples_are_normalized_windows(dataset):
+    for index in [0, 11, 36, 47]:
+        time, location = divmod(index, dataset.Z)
+        window = dataset.data[time : time + 5, location]
+        past, future = window[:3], window[3:]
+        mean, std = past.mean(), past.std(ddof=1)
+
+        sample = dataset[index]
+
+        np.testing.assert_allclose(
+            sample["past_targets"][:, 0], (past - mean) / std, rtol=1e-5
+        )
+        np.testing.assert_allclose(
+            sample["future_targets"][:, 0], (future - mean) / std, rtol=1e-5
+        )
+
+
+def test_nan_stays_in_its_window(dataset):
+    windows = torch.from_numpy(dataset.windows.reshape(-1, 5))
+    batch = normalize_windows(windows, num_past_steps=3)
+
+    nan_windows = torch.isnan(windows).any(dim=1)
+    nan_samples = torch.isnan(
+        torch.cat([batch["past_targets"], batch["future_targets"]], dim=1)
+    ).any(dim=(1, 2))
+
+    assert nan_windows.any()
+    assert (nan_samples == nan_windows).all()
+    assert not torch.isnan(batch["past_targets"][~nan_windows]).any()
+
+
+def test_data_loader_batches(dataset):
+    loader = DataLoader(dataset, batch_size=5, collate_fn=collate_batch)
+
+    batches = list(loader)
+
+    assert sum(len(batch["past_targets"]) for batch in batches) == len(dataset)
+    last = dataset.__getitems__(range(45, 48))
+    for key, value in batches[-1].items():
+        torch.testing.assert_close(value, last[key], equal_nan=True)
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+import xarray as xr
+from torch.utils.data import DataLoader
+
+from src.ndvi_stream_dataset import NDVIStreamDataset
+
+
+@pytest.fixture
+def root(tmp_path):
+    rng = np.random.default_rng(0)
+    # Values on a grid of 0.001, so windows can be recovered from normalized samples
+    values = rng.integers(0, 1000, (9, 4, 6)) / 1000
+    values[3, 0, 0] = np.nan
+    values[:, 3, 5] = np.nan
+    ndvi = xr.DataArray(
+        values,
+        dims=("time", "y", "x"),
+        coords={"time": pd.date_range("2024-01-01", periods=9, freq="8D")},
+    )
+    xr.Dataset({"ndvi_8d_processed": ndvi.chunk(y=2, x=2)}).to_zarr(
+        tmp_path / "ndvi_processed.zarr", mode="w"
+    )
+    return str(tmp_path), values
+
+
+def sorted_windows(windows):
+    windows = np.rint(windows * 1000).astype(int)
+    return windows[np.lexsort(windows.T[::-1])]
+
+
+def test_workers_yield_every_window_once(root):
+    root, values = root
+    dataset = NDVIStreamDataset(
+        root,
+        num_past_steps=3,
+        num_future_steps=2,
+        batch_size=4,
+        shuffle=True,
+        buffer_size=10,
+    )
+    loader = DataLoader(
+        dataset, batch_size=None, num_workers=2, multiprocessing_context="spawn"
+    )
+
+    batches = list(loader)
+
+    samples = torch.cat(
+        [
+            torch.cat([batch["past_targets"], batch["future_targets"]], dim=1)
+            * (batch["std"] + 1e-12)
+            + batch["mean"]
+            for batch in batches
+        ]
+    )
+    windows = np.lib.stride_tricks.sliding_window_view(
+        values.reshape(9, -1), 5, axis=0
+    ).reshape(-1, 5)
+    expected = windows[~np.isnan(windows).any(axis=1)]
+    assert len(dataset.blocks) == 6
+    np.testing.assert_array_equal(
+        sorted_windows(samples[..., 0].numpy()), sorted_windows(expected)
+    )
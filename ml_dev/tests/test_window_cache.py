@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import torch
+import xarray as xr
+
+from src.ndvi_dataset import NDVIDataset
+from src.window_cache import CachedNDVIDataset, cached_dataset, write_window_cache
+
+ARGS = {"num_past_steps": 3, "num_future_steps": 2, "num_locations": 12}
+
+
+def write_ndvi(root, seed):
+    values = np.random.default_rng(seed).random((8, 3, 4))
+    values[2, 1, 1] = np.nan
+    ndvi = xr.DataArray(values, dims=("time", "y", "x"))
+    xr.Dataset({"ndvi_8d_processed": ndvi}).to_zarr(
+        os.path.join(root, "ndvi_processed.zarr"), mode="w"
+    )
+
+
+def assert_same_samples(cached, dataset):
+    assert len(cached) == len(dataset)
+    indices = np.random.default_rng(0).permutation(len(dataset))
+    expected = dataset.__getitems__(indices)
+    for key, value in cached.__getitems__(indices).items():
+        torch.testing.assert_close(value, expected[key], equal_nan=True)
+
+
+def test_cached_windows_match_dataset(tmp_path):
+    write_ndvi(tmp_path, seed=0)
+    dataset = NDVIDataset(str(tmp_path), **ARGS)
+
+    write_window_cache(dataset, str(tmp_path / "cache"), shard_size=7)
+
+    assert_same_samples(CachedNDVIDataset(str(tmp_path / "cache")), dataset)
+
+
+def test_cache_is_rebuilt_when_the_store_changes(tmp_path):
+    root, cache_dir = str(tmp_path), str(tmp_path / "cache")
+    write_ndvi(root, seed=0)
+    first = cached_dataset(root, cache_dir, **ARGS)
+    assert cached_dataset(root, cache_dir, **ARGS).path == first.path
+
+    write_ndvi(root, seed=1)
+    second = cached_dataset(root, cache_dir, **ARGS)
+
+    assert second.path != first.path
+    assert_same_samples(second, NDVIDataset(root, **ARGS))
@@ -0,0 +1,30 @@
+import numpy as np
+
+from vhm_common.benchmark import compare, measure, synthetic_ndvi, write_report
+
+
+def test_synthetic_ndvi():
+    ndvi = synthetic_ndvi(20, 4, missing=0.5).compute()
+
+    assert ndvi.dims == ("time", "y", "x")
+    assert ndvi.shape == (4, 20, 20)
+    assert ndvi.dtype == np.float32
+    assert 0.3 < float(ndvi.isnull().mean()) < 0.7
+    np.testing.assert_array_equal(ndvi, synthetic_ndvi(20, 4, missing=0.5))
+
+
+def test_report_and_compare(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    result, record = measure("trend", "classify", lambda: 42, 100, resolution=300)
+    assert result == 42
+    assert record["pixels"] == 100
+    assert record["peak_rss_mb"] > 0
+    write_report([{**record, "seconds": 1.0}], path)
+    write_report([{**record, "name": "write_cog", "seconds": 1.0}], path)
+
+    current = str(tmp_path / "current.json")
+    write_report([{**record, "seconds": 1.1}], current)
+    assert compare(path, current) == []
+    # Replaces the result of the same case
+    write_report([{**record, "seconds": 2.0}], current)
+    assert compare(path, current) == [("trend", "classify", 300)]
@@ -0,0 +1,71 @@
+import numpy as np
+import xarray as xr
+
+from vhm_common.encoding import (
+    as_stored,
+    dataset_encoding,
+    recode_store,
+    write_chunks,
+)
+from vhm_common.storage import Storage
+
+
+def ndvi_dataset():
+    rng = np.random.default_rng(0)
+    ndvi = rng.uniform(-0.2, 0.9, (7, 250, 230)).astype(np.float32)
+    ndvi[:, :20, :20] = np.nan
+    return xr.Dataset(
+        {"ndvi_8d_raw": (("time", "y", "x"), ndvi)},
+        coords={"time": np.arange(7)},
+    )
+
+
+def test_ndvi_encoding_round_trip(tmp_path):
+    ds = ndvi_dataset()
+    store = str(tmp_path / "ndvi.zarr")
+    layout = {"chunks": {"time": 3, "y": 50, "x": 50}, "chunks_per_shard": {"y": 2}}
+    ds.to_zarr(store, mode="w", encoding=dataset_encoding(ds, **layout))
+
+    result = xr.open_zarr(store)["ndvi_8d_raw"]
+    assert result.encoding["dtype"] == np.int16
+    assert result.encoding["shards"] == (3, 100, 50)
+    assert write_chunks(result) == {"time": 3, "y": 100, "x": 50}
+    np.testing.assert_allclose(result.values, ds["ndvi_8d_raw"].values, atol=5e-5)
+
+    # Appended windows that are never written read as NaN
+    empty = xr.full_like(ds.isel(time=[0]), np.nan).assign_coords(time=[7])
+    empty.drop_encoding().to_zarr(store, mode="a", append_dim="time", compute=False)
+    assert xr.open_zarr(store)["ndvi_8d_raw"].isel(time=7).isnull().all()
+
+
+def test_as_stored(tmp_path):
+    ds = ndvi_dataset()
+    store = str(tmp_path / "ndvi.zarr")
+    ds.to_zarr(store, mode="w", encoding=dataset_encoding(ds))
+
+    result = xr.open_zarr(store)["ndvi_8d_raw"].values
+    np.testing.assert_array_equal(as_stored(ds["ndvi_8d_raw"]).values, result)
+    np.testing.assert_array_equal(
+        as_stored(ds["ndvi_8d_raw"].copy(data=result)), result
+    )
+
+    # A float store keeps the values
+    ds.to_zarr(store, mode="w")
+    encoding = xr.open_zarr(store)["ndvi_8d_raw"].encoding
+    result = as_stored(ds["ndvi_8d_raw"], encoding)
+    np.testing.assert_array_equal(result, ds["ndvi_8d_raw"])
+    assert result.dtype == np.float32
+
+
+def test_recode_store(tmp_path):
+    storage = Storage(str(tmp_path))
+    ds = ndvi_dataset()
+    ds.to_zarr(storage.zarr_store("float.zarr"), mode="w")
+
+    recode_store(storage, "float.zarr", "int16.zarr")
+
+    result = xr.open_zarr(storage.zarr_store("int16.zarr"))
+    assert result["ndvi_8d_raw"].encoding["dtype"] == np.int16
+    np.testing.assert_allclose(
+        result["ndvi_8d_raw"].values, ds["ndvi_8d_raw"].values, atol=5e-5
+    )
@@ -0,0 +1,24 @@
+import dask
+import dask.array as da
+
+from vhm_common.execution import (
+    SYNC_MAX_PIXELS,
+    THREADS_MAX_PIXELS,
+    dask_execution,
+    execution_mode,
+)
+
+
+def test_execution_mode():
+    assert execution_mode(SYNC_MAX_PIXELS, "auto") == "sync"
+    assert execution_mode(SYNC_MAX_PIXELS + 1, "auto") == "threads"
+    assert execution_mode(THREADS_MAX_PIXELS + 1, "auto") == "local"
+    assert execution_mode(1, "tcp://scheduler:8786") == "tcp://scheduler:8786"
+
+
+def test_dask_execution():
+    for mode, scheduler in [("sync", "synchronous"), ("threads", "threads")]:
+        with dask_execution(100, mode) as result:
+            assert result == mode
+            assert dask.config.get("scheduler") == scheduler
+            assert int(da.ones(100, chunks=10).sum().compute()) == 100
@@ -0,0 +1,44 @@
+import json
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from vhm_common.instrument import REPORT_DIR, run_report
+from vhm_common.storage import Storage
+
+
+def test_run_report(tmp_path):
+    storage = Storage(f"memory://{tmp_path.name}")
+    ds = xr.Dataset({"ndvi": (("y", "x"), np.ones((8, 8), np.float32))})
+
+    with run_report("test", storage) as report:
+        with report.phase("write"):
+            ds.chunk(4).to_zarr(storage.zarr_store("ndvi.zarr"))
+        report.metrics["pixels"] = 64
+
+    (name,) = storage.fs.ls(storage.path(REPORT_DIR), detail=False)
+    with storage.fs.open(name) as file:
+        result = json.load(file)
+    assert result["status"] == "succeeded"
+    assert result["metrics"] == {"pixels": 64}
+    (phase,) = result["phases"]
+    assert phase["name"] == "write"
+    assert phase["dask_tasks"] > 0
+    assert phase["peak_rss_mb"] > 0
+    assert phase["io"]["storage"]["requests"] > 0
+    assert phase["io"]["storage"]["bytes_written"] > 0
+
+
+def test_failed_run_report(tmp_path):
+    storage = Storage(f"memory://{tmp_path.name}")
+
+    with pytest.raises(ValueError), run_report("test", storage) as report:
+        with report.phase("fail"):
+            raise ValueError
+
+    (name,) = storage.fs.ls(storage.path(REPORT_DIR), detail=False)
+    with storage.fs.open(name) as file:
+        result = json.load(file)
+    assert result["status"] == "failed"
+    assert [phase["name"] for phase in result["phases"]] == ["fail"]
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from vhm_common.pixel_mask import (
+    MASK_VERSION,
+    build_valid_mask,
+    compact,
+    load_valid_mask,
+    pixel_index,
+    scatter,
+    update_valid_mask,
+)
+from vhm_common.storage import Storage
+
+
+def test_valid_mask(tmp_path):
+    ndvi = np.full((4, 2, 3), 0.3)
+    ndvi[:, 0, 0] = -0.1  # water
+    ndvi[:, 0, 1] = 0.05  # bare
+    ndvi[:, 0, 2] = np.nan  # never observed
+    ndvi[2, 1, 0] = np.nan
+    times = pd.date_range("2024-01-01", periods=4, freq="8D")
+    da = xr.DataArray(ndvi, dims=("time", "y", "x"), coords={"time": times})
+    storage = Storage(str(tmp_path))
+    xr.Dataset({"ndvi_8d_processed": da}).to_zarr(
+        storage.zarr_store("ndvi_processed.zarr"), mode="w"
+    )
+
+    assert load_valid_mask(storage) is None
+    update_valid_mask(storage)
+    valid = load_valid_mask(storage)
+
+    expected = [[False, False, False], [True, True, True]]
+    np.testing.assert_array_equal(valid.values, expected)
+    xr.testing.assert_identical(build_valid_mask(da)["valid"], valid)
+    assert build_valid_mask(da).attrs["version"] == MASK_VERSION
+
+
+def test_compact_scatter_round_trip():
+    da = xr.DataArray(np.arange(24.0).reshape(2, 3, 4), dims=("time", "y", "x"))
+    valid = xr.DataArray(np.arange(12).reshape(3, 4) % 5 == 0, dims=("y", "x"))
+    index = pixel_index(valid)
+
+    pixels = compact(da, index)
+    grid = scatter(pixels, index, (3, 4))
+
+    assert pixels.shape == (2, 3)
+    np.testing.assert_array_equal(grid[:, valid.values], da.values[:, valid.values])
+    assert np.isnan(grid[:, ~valid.values]).all()
+
+
+def test_valid_mask_on_another_grid_is_stale(tmp_path):
+    storage = Storage(str(tmp_path))
+    times = pd.date_range("2024-01-01", periods=2, freq="8D")
+
+    def write_ndvi(x):
+        da = xr.DataArray(
+            np.full((2, 2, len(x)), 0.3),
+            dims=("time", "y", "x"),
+            coords={"time": times, "y": [10.0, 0.0], "x": x},
+        )
+        xr.Dataset({"ndvi_8d_processed": da}).to_zarr(
+            storage.zarr_store("ndvi_processed.zarr"), mode="w"
+        )
+
+    write_ndvi([0.0, 10.0, 20.0])
+    update_valid_mask(storage)
+    assert load_valid_mask(storage) is not None
+
+    write_ndvi([5.0, 15.0, 25.0])
+    assert load_valid_mask(storage) is None
+    write_ndvi([0.0, 10.0, 20.0, 30.0])
+    assert load_valid_mask(storage) is None
+
+    update_valid_mask(storage)
+    assert load_valid_mask(storage).sizes == {"y": 2, "x": 4}
+
+
+def test_valid_mask_is_updated_with_new_history(tmp_path):
+    storage = Storage(str(tmp_path))
+    ndvi = np.full((6, 1, 2), 0.3)
+    ndvi[:, 0, 1] = [0.02, 0.03, 0.04, 0.06, 0.09, 0.12]  # greening
+    times = pd.date_range("2024-01-01", periods=6, freq="8D")
+    da = xr.DataArray(ndvi, dims=("time", "y", "x"), coords={"time": times})
+
+    def write_ndvi(steps):
+        xr.Dataset({"ndvi_8d_processed": da.isel(time=slice(steps))}).to_zarr(
+            storage.zarr_store("ndvi_processed.zarr"), mode="w"
+        )
+
+    write_ndvi(4)
+    update_valid_mask(storage)
+    np.testing.assert_array_equal(load_valid_mask(storage).values, [[True, False]])
+
+    write_ndvi(6)
+    assert load_valid_mask(storage) is None
+    update_valid_mask(storage)
+    valid = load_valid_mask(storage)
+
+    np.testing.assert_array_equal(valid.values, [[True, True]])
+    xr.testing.assert_identical(build_valid_mask(da)["valid"], valid)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from vhm_common.storage import Storage, storage_from_env
+
+
+@pytest.fixture(params=["local", "memory"])
+def storage(request, tmp_path):
+    if request.param == "local":
+        return Storage(str(tmp_path / "bucket"))
+    return Storage(f"memory://{tmp_path.name}")
+
+
+def test_files(storage, tmp_path):
+    with storage.open("nested/aoi.geojson", "w") as file:
+        file.write("{}")
+    assert storage.exists("nested/aoi.geojson")
+
+    local_path = tmp_path / "aoi.geojson"
+    storage.download("nested/aoi.geojson", local_path)
+    assert local_path.read_text() == "{}"
+
+    storage.upload(local_path, "copy.geojson")
+    with storage.open("copy.geojson") as file:
+        assert file.read() == "{}"
+
+    storage.remove("copy.geojson")
+    assert not storage.exists("copy.geojson")
+
+
+def test_zarr_store(storage):
+    ds = xr.Dataset({"ndvi": (("y", "x"), np.random.rand(3, 4))})
+    assert not storage.zarr_exists("ndvi.zarr")
+
+    ds.to_zarr(storage.zarr_store("ndvi.zarr"), mode="w")
+
+    assert storage.zarr_exists("ndvi.zarr")
+    xr.testing.assert_identical(
+        xr.open_zarr(storage.zarr_store("ndvi.zarr")).load(), ds
+    )
+
+
+def test_storage_from_env(monkeypatch, tmp_path):
+    monkeypatch.delenv("STORAGE_URL", raising=False)
+    monkeypatch.setenv("S3_BUCKET", "my-bucket")
+    assert storage_from_env().url == "s3://my-bucket"
+
+    monkeypatch.setenv("STORAGE_URL", str(tmp_path))
+    assert storage_from_env().root == str(tmp_path)
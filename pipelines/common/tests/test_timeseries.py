@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from vhm_common.storage import Storage
+from vhm_common.timeseries import (
+    MIRRORS,
+    open_timeseries,
+    pixel_series,
+    polygon_series,
+    update_mirrors,
+)
+
+DATES = pd.date_range("2024-01-01", periods=13, freq="8D")
+NDVI = np.random.default_rng(0).uniform(0, 0.8, (len(DATES), 40, 30))
+
+
+def ndvi_dataset(name, time, ndvi=NDVI):
+    return xr.Dataset(
+        {name: (("time", "y", "x"), ndvi[time])},
+        coords={
+            "time": DATES[time],
+            "y": 1000 - 30 * np.arange(40),
+            "x": 30 * np.arange(30),
+        },
+    )
+
+
+def test_mirrors(tmp_path):
+    storage = Storage(str(tmp_path))
+    ndvi_store = storage.zarr_store("ndvi_processed.zarr")
+    ndvi_dataset("ndvi_8d_processed", slice(0, 10)).to_zarr(ndvi_store, mode="w")
+    preds = ndvi_dataset("ndvi_8d_forecast", slice(10, 13))
+    preds.to_zarr(storage.zarr_store("ndvi_predictions.zarr"), mode="w")
+    update_mirrors(storage)
+
+    # The next run rewrites the last window and adds two
+    values = NDVI.copy()
+    values[9] = 0.5
+    ndvi = ndvi_dataset("ndvi_8d_processed", slice(0, 12), values)
+    ndvi.to_zarr(ndvi_store, mode="w")
+    update_mirrors(storage)
+
+    mirror = xr.open_zarr(storage.zarr_store(MIRRORS["ndvi_processed.zarr"]))
+    assert mirror["ndvi_8d_processed"].encoding["chunks"] == (64, 16, 16)
+    np.testing.assert_allclose(
+        mirror["ndvi_8d_processed"].values, ndvi["ndvi_8d_processed"].values, atol=5e-5
+    )
+
+    ts = open_timeseries(storage)
+    series = pixel_series(ts, x=95, y=950)
+    assert list(series.index) == list(DATES)
+    np.testing.assert_allclose(series["ndvi"][:12], values[:12, 2, 3], atol=5e-5)
+    np.testing.assert_allclose(series["forecast"][10:], NDVI[10:, 2, 3], atol=5e-5)
+
+    square = {
+        "type": "Polygon",
+        "coordinates": [[(-10, 1010), (-10, 950), (50, 950), (50, 1010), (-10, 1010)]],
+    }
+    np.testing.assert_allclose(
+        polygon_series(ts, square)["ndvi"][:12],
+        values[:12, :2, :2].mean(axis=(1, 2)),
+        atol=5e-5,
+    )
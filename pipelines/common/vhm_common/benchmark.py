@@ -0,0 +1,160 @@
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import dask.array as da
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from vhm_common.instrument import peak_rss, reset_peak_rss
+
+# Synthetic AOIs are AOI_EXTENT meters wide, BENCHMARK_RESOLUTION=300 is 200 x 200
+# pixels and BENCHMARK_RESOLUTION=30 is the 2000 x 2000 pixels of Landsat
+AOI_EXTENT = 60000
+ORIGIN = (600000, 1530000)
+CRS = "EPSG:32630"
+BENCHMARK_RESOLUTION = int(os.environ.get("BENCHMARK_RESOLUTION", 300))
+BENCHMARK_OUTPUT = os.environ.get("BENCHMARK_OUTPUT", "benchmark_results.json")
+# Comma separated stage/name cases to run, e.g. "inference/forecast_batched", all if empty
+BENCHMARK_CASES = [c for c in os.environ.get("BENCHMARK_CASES", "").split(",") if c]
+# A case is a regression if it takes this much longer than the baseline
+BENCHMARK_TOLERANCE = float(os.environ.get("BENCHMARK_TOLERANCE", 0.2))
+# and the difference is more than the timing noise of short cases
+NOISE_SECONDS = 0.05
+CHUNK_SIZE = 500
+
+
+def grid_size(resolution=BENCHMARK_RESOLUTION):
+    return AOI_EXTENT // resolution
+
+
+def synthetic_ndvi(size, num_times, missing=0.0, seed=0, start="2024-01-01"):
+    """Lazy (time, y, x) float32 NDVI with a seasonal signal, like synthetic scenes.
+
+    Each pixel has its own offset from the seasonal mean, and a fraction missing of the
+    values is NaN.
+    """
+    rng = da.random.default_rng(seed)
+    times = pd.date_range(start, periods=num_times, freq="8D")
+    season = 0.15 + 0.1 * np.sin(2 * np.pi * (times.dayofyear.values - 180) / 365)
+    chunks = (1, CHUNK_SIZE, CHUNK_SIZE)
+    shape = (num_times, size, size)
+    values = (
+        da.from_array(season[:, None, None], chunks=(1, 1, 1))
+        + rng.normal(0, 0.05, (1, size, size), chunks=chunks)
+        + rng.normal(0, 0.02, shape, chunks=chunks)
+    ).astype(np.float32)
+    if missing:
+        values = da.where(rng.random(shape, chunks=chunks) < missing, np.nan, values)
+    resolution = AOI_EXTENT / size
+    return xr.DataArray(
+        values,
+        dims=("time", "y", "x"),
+        coords={
+            "time": times,
+            "y": ORIGIN[1] - resolution * (np.arange(size) + 0.5),
+            "x": ORIGIN[0] + resolution * (np.arange(size) + 0.5),
+        },
+    )
+
+
+def selected(stage, name, cases=BENCHMARK_CASES):
+    return not cases or f"{stage}/{name}" in cases
+
+
+def measure(stage, name, fn, pixels, **params):
+    """Run fn and return its result and a record of its wall time and peak RSS.
+
+    pixels is the number of pixels fn processes, e.g. pixels times scenes for ingest.
+    """
+    gc.collect()
+    reset_peak_rss()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    record = {
+        "stage": stage,
+        "name": name,
+        "seconds": round(seconds, 4),
+        "peak_rss_mb": round(peak_rss() / 2**20, 1),
+        "pixels": pixels,
+        "pixels_per_second": round(pixels / seconds),
+        **params,
+    }
+    print(
+        f"{stage}/{name}: {seconds:.2f} s, {record['pixels_per_second']} pixels/s, "
+        f"peak RSS {record['peak_rss_mb']:.0f} MB"
+    )
+    return result, record
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(record):
+    return record["stage"], record["name"], record.get("resolution")
+
+
+def write_report(records, path=BENCHMARK_OUTPUT):
+    """Add records to the JSON report at path, replacing earlier runs of the same cases.
+
+    The pipelines have their own environments, so each adds its stages to the report.
+    """
+    results = []
+    if os.path.exists(path):
+        with open(path) as file:
+            results = json.load(file)["results"]
+    environment = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+    records = [{**record, **environment} for record in records]
+    keys = {case_key(record) for record in records}
+    results = [r for r in results if case_key(r) not in keys] + records
+    with open(path, "w") as file:
+        json.dump({"results": results}, file, indent=2)
+    print(f"Wrote {len(records)} results to {path}.")
+
+
+def compare(baseline, current, tolerance=BENCHMARK_TOLERANCE):
+    """Print the change of the cases in both reports, returns the regressed cases."""
+    with open(baseline) as file:
+        before = {case_key(r): r for r in json.load(file)["results"]}
+    with open(current) as file:
+        after = {case_key(r): r for r in json.load(file)["results"]}
+    regressions = []
+    for key in sorted(before.keys() & after.keys(), key=str):
+        ratio = after[key]["seconds"] / before[key]["seconds"]
+        memory = after[key]["peak_rss_mb"] - before[key]["peak_rss_mb"]
+        slower = after[key]["seconds"] - before[key]["seconds"]
+        regressed = ratio > 1 + tolerance and slower > NOISE_SECONDS
+        if regressed:
+            regressions.append(key)
+        stage, name, resolution = key
+        print(
+            f"{stage}/{name} at {resolution} m: {before[key]['seconds']:.2f} s -> "
+            f"{after[key]['seconds']:.2f} s ({ratio:.2f}x), peak RSS {memory:+.0f} MB"
+            + (" REGRESSION" if regressed else "")
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    # python -m vhm_common.benchmark <baseline report> <current report>
+    sys.exit(1 if compare(sys.argv[1], sys.argv[2]) else 0)
@@ -0,0 +1,101 @@
+import sys
+
+import numpy as np
+import xarray as xr
+from zarr.codecs import BloscCodec
+
+from vhm_common.storage import storage_from_env
+
+# NDVI is in [-1, 1], so int16 with a 1e-4 scale keeps 4 decimals in half the bytes of
+# float32. NaN is written as the nodata sentinel.
+NDVI_SCALE_FACTOR = 1e-4
+NDVI_NODATA = -32768
+COMPRESSORS = (BloscCodec(cname="zstd", clevel=5, shuffle="shuffle"),)
+# Chunks are the unit of reads. Shards group chunks into a single object, so a
+# 1000 x 1000 pixel area is one S3 object per 3 time steps instead of 100.
+CHUNKS = {"time": 3, "y": 100, "x": 100}
+CHUNKS_PER_SHARD = {"time": 1, "y": 10, "x": 10}
+
+
+def zarr_layout(da, chunks=CHUNKS, chunks_per_shard=CHUNKS_PER_SHARD):
+    """Chunk and shard shape for a variable, dimensions not in chunks are not split."""
+    chunk_shape = tuple(chunks.get(dim, da.sizes[dim]) for dim in da.dims)
+    shard_shape = tuple(
+        size * chunks_per_shard.get(dim, 1) for dim, size in zip(da.dims, chunk_shape)
+    )
+    return {"chunks": chunk_shape, "shards": shard_shape, "compressors": COMPRESSORS}
+
+
+def ndvi_encoding(da, **layout):
+    """Scaled int16 encoding with a nodata sentinel for an NDVI variable."""
+    return {
+        **zarr_layout(da, **layout),
+        "dtype": "int16",
+        "scale_factor": NDVI_SCALE_FACTOR,
+        "_FillValue": NDVI_NODATA,
+        # Also the Zarr fill value, so chunks that were never written read as NaN
+        "fill_value": NDVI_NODATA,
+    }
+
+
+def as_stored(da, encoding=None):
+    """da as it reads back from a store, e.g. in 1e-4 steps with the NDVI encoding.
+
+    encoding is the encoding of the variable in the store, the NDVI encoding by default.
+    """
+    variable = da.variable.copy(deep=False)
+    variable.encoding = dict(ndvi_encoding(da) if encoding is None else encoding)
+    encoded = xr.conventions.encode_cf_variable(variable, name=da.name)
+    return da.copy(data=xr.conventions.decode_cf_variable(da.name, encoded).values)
+
+
+def dataset_encoding(ds, **layout):
+    """Encoding for every data variable, NDVI for floats and only the layout otherwise."""
+    return {
+        name: ndvi_encoding(da, **layout)
+        if np.issubdtype(da.dtype, np.floating)
+        else zarr_layout(da, **layout)
+        for name, da in ds.data_vars.items()
+    }
+
+
+def write_chunks(da):
+    """Dask chunks for writing a variable back to its store, one shard per chunk if sharded.
+
+    Chunks in the same shard are stored in one object, so they must not be written by
+    different tasks.
+    """
+    shape = da.encoding.get("shards") or da.encoding.get("chunks")
+    if shape is None:
+        return {dim: sizes[0] for dim, sizes in da.chunksizes.items()}
+    return dict(zip(da.dims, shape))
+
+
+def store_layout(da):
+    """The layout arguments of zarr_layout matching a variable in an existing store."""
+    chunks = dict(zip(da.dims, da.encoding["chunks"]))
+    shards = write_chunks(da)
+    return {
+        "chunks": chunks,
+        "chunks_per_shard": {dim: shards[dim] // chunks[dim] for dim in da.dims},
+    }
+
+
+def write_encoded(ds, store, **layout):
+    """Write a new store with the NDVI encoding, rechunked so each shard is one dask chunk."""
+    encoding = dataset_encoding(ds, **layout)
+    ds = ds.copy()
+    for name in ds.data_vars:
+        ds[name] = ds[name].chunk(dict(zip(ds[name].dims, encoding[name]["shards"])))
+    ds.drop_encoding().to_zarr(store, mode="w", encoding=encoding, consolidated=True)
+
+
+def recode_store(storage, source, target, **layout):
+    """Copy a store with the NDVI encoding, e.g. to migrate a float store."""
+    ds = xr.open_zarr(storage.zarr_store(source))
+    write_encoded(ds, storage.zarr_store(target), **layout)
+
+
+if __name__ == "__main__":
+    # python -m vhm_common.encoding <source store> <target store>
+    recode_store(storage_from_env(), sys.argv[1], sys.argv[2])
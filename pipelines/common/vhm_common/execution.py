@@ -0,0 +1,47 @@
+import importlib.util
+import os
+from contextlib import contextmanager
+
+import dask
+
+# "auto" chooses from the size of the work, otherwise "sync", "threads", "local" (a local
+# distributed cluster) or the address of a dask scheduler, e.g. tcp://scheduler:8786
+DASK_EXECUTION = os.environ.get("DASK_EXECUTION", "auto")
+# Work is counted in pixels times windows. "auto" runs up to SYNC_MAX_PIXELS in this
+# thread, e.g. one window of a 1000 x 1000 AOI, up to THREADS_MAX_PIXELS in a thread
+# pool, e.g. 60 windows of 2000 x 2000 pixels, and more on a local cluster.
+SYNC_MAX_PIXELS = int(os.environ.get("SYNC_MAX_PIXELS", 1_000_000))
+THREADS_MAX_PIXELS = int(os.environ.get("THREADS_MAX_PIXELS", 250_000_000))
+
+
+def execution_mode(pixels, mode=DASK_EXECUTION):
+    """The execution of work on pixels, mode itself unless it is "auto"."""
+    if mode != "auto":
+        return mode
+    if pixels <= SYNC_MAX_PIXELS:
+        return "sync"
+    if pixels <= THREADS_MAX_PIXELS or importlib.util.find_spec("distributed") is None:
+        return "threads"
+    return "local"
+
+
+@contextmanager
+def dask_execution(pixels, mode=DASK_EXECUTION):
+    """Run the dask computations of the block with the execution for the work.
+
+    A cluster is only started, and distributed imported, if the execution needs one.
+    Yields the execution mode.
+    """
+    mode = execution_mode(pixels, mode)
+    print(f"Dask execution: {mode} for {pixels} pixels.")
+    if mode in ("sync", "threads"):
+        scheduler = "synchronous" if mode == "sync" else "threads"
+        with dask.config.set(scheduler=scheduler):
+            yield mode
+        return
+
+    from distributed import Client
+
+    with Client() if mode == "local" else Client(mode) as client:
+        print(client)
+        yield mode
@@ -0,0 +1,290 @@
+import functools
+import inspect
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from dask.callbacks import Callback
+from dask.utils import key_split
+
+# Run reports are written to REPORT_DIR next to the stores, e.g.
+# run_reports/inference_20240601T000000.json
+REPORT_DIR = "run_reports"
+# Also write a dask performance report (HTML) of the run, needs a distributed client
+PERFORMANCE_REPORT = os.environ.get("PERFORMANCE_REPORT", "false").lower() == "true"
+
+# fsspec methods that transfer data, and how to count the bytes of a call
+IO_METHODS = {
+    "cat_file": lambda result, args: {"bytes_read": len(result)},
+    "cat_ranges": lambda result, args: {
+        "requests": len(result),
+        "bytes_read": sum(len(r) for r in result if isinstance(r, bytes)),
+    },
+    "pipe_file": lambda result, args: {"bytes_written": len(args[1])},
+    "get_file": lambda result, args: {"bytes_read": os.path.getsize(args[1])},
+    "put_file": lambda result, args: {"bytes_written": os.path.getsize(args[0])},
+}
+
+
+def reset_peak_rss():
+    """Start measuring peak RSS from the current RSS, only supported on Linux."""
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """Peak RSS in bytes since reset_peak_rss, or since the process started."""
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def count_fs_io(fs, report, kind="storage"):
+    """Count the requests and bytes of the data transfers of an fsspec filesystem.
+
+    fsspec caches filesystem instances, so a filesystem is only wrapped once and counts
+    into the last report it was given. Only this process is counted, not the workers of
+    a distributed cluster.
+    """
+    already_counted = hasattr(fs, "_run_report")
+    fs._run_report = (report, kind)
+    if already_counted:
+        return
+
+    def counted(method, measure):
+        def count(result, args):
+            report, kind = fs._run_report
+            report.count_io(kind, **{"requests": 1, **measure(result, args)})
+
+        if inspect.iscoroutinefunction(method):
+
+            @functools.wraps(method)
+            async def wrapper(*args, **kwargs):
+                result = await method(*args, **kwargs)
+                count(result, args)
+                return result
+
+        else:
+
+            @functools.wraps(method)
+            def wrapper(*args, **kwargs):
+                result = method(*args, **kwargs)
+                count(result, args)
+                return result
+
+        return wrapper
+
+    for name, measure in IO_METHODS.items():
+        for method_name in (name, f"_{name}"):
+            method = getattr(fs, method_name, None)
+            if method is not None:
+                setattr(fs, method_name, counted(method, measure))
+
+
+def count_requests_io(session, report, kind):
+    """Count the requests and response bytes of a requests session."""
+
+    def hook(response, *args, **kwargs):
+        report.count_io(kind, requests=1, bytes_read=len(response.content))
+
+    session.hooks["response"].append(hook)
+
+
+class TaskCounter(Callback):
+    """Count and time the tasks run by the local dask schedulers."""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.starts = {}
+        self.tasks = defaultdict(lambda: {"count": 0, "seconds": 0.0})
+
+    def _pretask(self, key, dsk, state):
+        self.starts[key] = time.perf_counter()
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        seconds = time.perf_counter() - self.starts.pop(key, time.perf_counter())
+        with self.lock:
+            task = self.tasks[key_split(key)]
+            task["count"] += 1
+            task["seconds"] += seconds
+
+
+def distributed_client():
+    # No client can be running if distributed was never imported
+    if "distributed" not in sys.modules:
+        return None
+    try:
+        from distributed import default_client
+
+        return default_client()
+    except (ImportError, ValueError):
+        return None
+
+
+def task_stream_profile(records):
+    """Count and compute time of tasks by key prefix from a distributed task stream."""
+    tasks = defaultdict(lambda: {"count": 0, "seconds": 0.0})
+    for record in records:
+        task = tasks[key_split(record["key"])]
+        task["count"] += 1
+        task["seconds"] += sum(
+            s["stop"] - s["start"]
+            for s in record["startstops"]
+            if s["action"] == "compute"
+        )
+    return tasks
+
+
+class RunReport:
+    """Wall time, peak memory, I/O and dask tasks of the phases of a pipeline run."""
+
+    def __init__(self, stage, storage=None):
+        self.stage = stage
+        self.started = datetime.now(timezone.utc)
+        self.status = "running"
+        self.phases = []
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.io = defaultdict(
+            lambda: {"requests": 0, "bytes_read": 0, "bytes_written": 0}
+        )
+        if storage is not None:
+            count_fs_io(storage.fs, self)
+
+    def count_io(self, kind, requests=0, bytes_read=0, bytes_written=0):
+        with self.lock:
+            io = self.io[kind]
+            io["requests"] += requests
+            io["bytes_read"] += bytes_read
+            io["bytes_written"] += bytes_written
+
+    def io_snapshot(self):
+        with self.lock:
+            return {kind: dict(io) for kind, io in self.io.items()}
+
+    @contextmanager
+    def phase(self, name):
+        """Record the wall and CPU time, peak RSS, I/O and dask tasks of a block."""
+        io_before = self.io_snapshot()
+        reset_peak_rss()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        client = distributed_client()
+        if client is not None:
+            from distributed import get_task_stream
+
+            task_stream = get_task_stream(client)
+        else:
+            task_stream = TaskCounter()
+        try:
+            with task_stream:
+                yield self
+        finally:
+            self._record_phase(name, start, cpu_start, io_before, client, task_stream)
+
+    def _record_phase(self, name, start, cpu_start, io_before, client, task_stream):
+        if client is not None:
+            tasks = task_stream_profile(task_stream.data)
+        else:
+            tasks = task_stream.tasks
+        io = {
+            kind: {
+                key: value - io_before.get(kind, {}).get(key, 0)
+                for key, value in counts.items()
+            }
+            for kind, counts in self.io_snapshot().items()
+        }
+        record = {
+            "name": name,
+            "seconds": round(time.perf_counter() - start, 3),
+            "cpu_seconds": round(time.process_time() - cpu_start, 3),
+            "peak_rss_mb": round(peak_rss() / 2**20, 1),
+            "io": {kind: counts for kind, counts in io.items() if any(counts.values())},
+            "dask_tasks": sum(task["count"] for task in tasks.values()),
+            "task_profile": {
+                prefix: {"count": task["count"], "seconds": round(task["seconds"], 3)}
+                for prefix, task in sorted(
+                    tasks.items(), key=lambda item: -item[1]["seconds"]
+                )
+            },
+        }
+        self.phases.append(record)
+        print(
+            f"Phase {name}: {record['seconds']:.1f} s, "
+            f"peak RSS {record['peak_rss_mb']:.0f} MB, {record['dask_tasks']} tasks."
+        )
+
+    def to_dict(self):
+        return {
+            "stage": self.stage,
+            "status": self.status,
+            "started": self.started.isoformat(),
+            "seconds": round(
+                (datetime.now(timezone.utc) - self.started).total_seconds(), 3
+            ),
+            # Phases reset the peak RSS of the process
+            "peak_rss_mb": max(
+                [round(peak_rss() / 2**20, 1)]
+                + [phase["peak_rss_mb"] for phase in self.phases]
+            ),
+            "phases": self.phases,
+            "io": self.io_snapshot(),
+            "metrics": self.metrics,
+        }
+
+    def name(self, suffix):
+        return f"{REPORT_DIR}/{self.stage}_{self.started:%Y%m%dT%H%M%S}{suffix}"
+
+    def write(self, storage):
+        with storage.open(self.name(".json"), "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+        print(f"Run report written to {storage.path(self.name('.json'))}.")
+
+
+@contextmanager
+def run_report(stage, storage, performance_report=PERFORMANCE_REPORT):
+    """A RunReport of the block, written to storage when it ends, even if it fails.
+
+    With performance_report, a dask performance report of the block is written next to
+    it if a distributed client is running.
+    """
+    report = RunReport(stage, storage)
+    with tempfile.TemporaryDirectory() as tmp:
+        html = os.path.join(tmp, "performance.html")
+        try:
+            if performance_report and distributed_client() is not None:
+                from distributed import performance_report as dask_report
+
+                with dask_report(filename=html):
+                    yield report
+            else:
+                yield report
+            report.status = "succeeded"
+        except BaseException:
+            report.status = "failed"
+            raise
+        finally:
+            # A report that can't be written doesn't fail the run
+            try:
+                report.write(storage)
+                if os.path.exists(html):
+                    storage.upload(html, report.name(".html"))
+            except Exception as e:
+                print(f"Run report was not written: {e}")
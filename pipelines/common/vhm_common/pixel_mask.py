@@ -0,0 +1,105 @@
+import numpy as np
+import xarray as xr
+
+from vhm_common.storage import storage_from_env
+
+MASK_PATH = "valid_pixel_mask.zarr"
+NDVI_ZARR_PATH = "ndvi_processed.zarr"
+# Bump when the criteria change, so masks built with older criteria are rebuilt
+MASK_VERSION = 1
+# Pixels that never rise above the bare threshold of the trend classification are
+# water, permanently bare ground or never observed
+BARE_THRESHOLD = 0.08
+
+
+def build_valid_mask(ndvi, bare_threshold=BARE_THRESHOLD):
+    """Pixels worth processing, where NDVI is above bare_threshold at some time."""
+    # NaN compares as False, so pixels that are always NaN are not valid
+    valid = (ndvi > bare_threshold).any("time")
+    return xr.Dataset(
+        {"valid": valid.drop_vars("time", errors="ignore")},
+        attrs={
+            "version": MASK_VERSION,
+            "bare_threshold": bare_threshold,
+            "start": str(ndvi.time.values[0]),
+            "end": str(ndvi.time.values[-1]),
+        },
+    )
+
+
+def same_grid(a, b):
+    """Whether a and b have the same y and x coordinates."""
+    return all(
+        a.sizes.get(dim) == b.sizes.get(dim) and np.array_equal(a[dim], b[dim])
+        for dim in ("y", "x")
+    )
+
+
+def open_mask(storage, ndvi):
+    """The stored mask if it was built with the current criteria on the grid of ndvi."""
+    if not storage.zarr_exists(MASK_PATH):
+        return None
+    mask = xr.open_zarr(storage.zarr_store(MASK_PATH))
+    if mask.attrs.get("version") != MASK_VERSION or not same_grid(mask, ndvi):
+        return None
+    return mask
+
+
+def load_valid_mask(storage, ndvi=None):
+    """The valid pixel mask, or None if it is missing or stale.
+
+    A mask is stale if it was built with other criteria, on another grid than ndvi, by
+    default the NDVI store, or before the last time step of ndvi.
+    """
+    if ndvi is None:
+        ndvi = xr.open_zarr(storage.zarr_store(NDVI_ZARR_PATH))
+    mask = open_mask(storage, ndvi)
+    if mask is None or np.datetime64(mask.attrs["end"]) < ndvi.time.values[-1]:
+        return None
+    return mask["valid"].load()
+
+
+def update_valid_mask(storage):
+    """Update the mask with the history in the NDVI store and write it.
+
+    Only the time steps after the end of a current mask are read, a pixel is valid if it
+    was valid before or is above the threshold in one of them.
+    """
+    ndvi = xr.open_zarr(storage.zarr_store(NDVI_ZARR_PATH))["ndvi_8d_processed"]
+    mask = open_mask(storage, ndvi)
+    if mask is None:
+        mask = build_valid_mask(ndvi).compute()
+    else:
+        new = ndvi.time > np.datetime64(mask.attrs["end"])
+        if not new.any():
+            return mask["valid"].load()
+        added = build_valid_mask(ndvi.sel(time=new)).compute()
+        added["valid"] = added["valid"] | mask["valid"].load()
+        added.attrs["start"] = mask.attrs["start"]
+        mask = added
+    mask.to_zarr(storage.zarr_store(MASK_PATH), mode="w", consolidated=True)
+    return mask["valid"]
+
+
+def pixel_index(valid):
+    """Flat indices of the valid pixels in a (y, x) grid."""
+    return np.flatnonzero(valid.transpose("y", "x").values)
+
+
+def compact(da, index):
+    """Values of the pixels in index, the y and x dimensions become one last axis."""
+    values = da.transpose(..., "y", "x").values
+    return values.reshape(*values.shape[:-2], -1)[..., index]
+
+
+def scatter(values, index, shape, fill_value=np.nan):
+    """Inverse of compact, pixels not in index are set to fill_value."""
+    grid = np.full((*values.shape[:-1], shape[0] * shape[1]), fill_value, values.dtype)
+    grid[..., index] = values
+    return grid.reshape(*values.shape[:-1], *shape)
+
+
+if __name__ == "__main__":
+    # python -m vhm_common.pixel_mask
+    valid = update_valid_mask(storage_from_env())
+    print(f"{float(valid.mean()):.1%} of pixels are valid.")
@@ -0,0 +1,67 @@
+import os
+
+import fsspec
+
+# Files are uploaded to S3 in parts of UPLOAD_PART_SIZE, UPLOAD_CONCURRENCY at a time
+UPLOAD_PART_SIZE = int(os.environ.get("UPLOAD_PART_SIZE", 16 * 2**20))
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", 10))
+
+
+class Storage:
+    """Files and Zarr stores under a single root.
+
+    The root can be an S3 bucket (s3://bucket), a local directory or an in-memory
+    filesystem (memory://name). S3 compatible services such as MinIO or moto are
+    selected with the standard AWS_ENDPOINT_URL environment variable.
+    """
+
+    def __init__(self, url, **storage_options):
+        protocol = fsspec.core.split_protocol(url)[0] or "file"
+        if protocol == "file":
+            storage_options.setdefault("auto_mkdir", True)
+        self.is_s3 = protocol in ("s3", "s3a")
+        if self.is_s3:
+            storage_options.setdefault("max_concurrency", UPLOAD_CONCURRENCY)
+        self.url = url
+        self.fs, self.root = fsspec.core.url_to_fs(url, **storage_options)
+
+    def __repr__(self):
+        return f"Storage({self.url!r})"
+
+    def path(self, name):
+        return f"{self.root.rstrip('/')}/{name}"
+
+    def exists(self, name):
+        return self.fs.exists(self.path(name))
+
+    def zarr_exists(self, name):
+        return self.exists(f"{name}/zarr.json")
+
+    def remove(self, name):
+        if self.exists(name):
+            self.fs.rm(self.path(name), recursive=True)
+
+    def open(self, name, mode="r"):
+        return self.fs.open(self.path(name), mode)
+
+    def zarr_store(self, name):
+        return self.fs.get_mapper(self.path(name), check=False)
+
+    def upload(self, local_path, name):
+        if self.is_s3:
+            self.fs.put_file(
+                str(local_path), self.path(name), chunksize=UPLOAD_PART_SIZE
+            )
+        else:
+            self.fs.put_file(str(local_path), self.path(name))
+
+    def download(self, name, local_path):
+        self.fs.get_file(self.path(name), str(local_path))
+
+
+def storage_from_env():
+    """Storage at STORAGE_URL, or the S3_BUCKET bucket if it is not set."""
+    url = os.environ.get("STORAGE_URL")
+    if url is None:
+        url = f"s3://{os.environ['S3_BUCKET']}"
+    return Storage(url)
@@ -0,0 +1,118 @@
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from vhm_common.encoding import write_encoded
+from vhm_common.storage import storage_from_env
+from vhm_common.upsert import upsert
+
+# The pipeline stores are chunked for appending windows, so the history of a pixel is
+# spread over a chunk every 3 windows. The mirrors hold the same data in chunks of 64
+# windows (1.4 years) over small areas. Longer chunks would make updates rewrite more.
+MIRRORS = {
+    "ndvi_processed.zarr": "ndvi_processed_timeseries.zarr",
+    "ndvi_predictions.zarr": "ndvi_predictions_timeseries.zarr",
+}
+MIRROR_CHUNKS = {"time": 64, "y": 16, "x": 16}
+MIRROR_CHUNKS_PER_SHARD = {"time": 1, "y": 8, "x": 8}
+# Recent windows are rewritten by ingest and forecasts are overwritten by the next
+# run, so the last MIRROR_OVERLAP time steps are copied again on every update
+MIRROR_OVERLAP = int(os.environ.get("MIRROR_OVERLAP", 4))
+
+
+def update_mirror(storage, source, target, overlap=MIRROR_OVERLAP):
+    """Copy the new and last overlap time steps of source to its time series mirror.
+
+    The mirror is rebuilt from the full history if it is missing or doesn't match the
+    grid of source.
+    """
+    ds = xr.open_zarr(storage.zarr_store(source))
+    store = storage.zarr_store(target)
+    if storage.zarr_exists(target):
+        mirror = xr.open_zarr(store)
+        if (
+            mirror.sizes["y"] == ds.sizes["y"]
+            and mirror.sizes["x"] == ds.sizes["x"]
+            and mirror.time.size
+            and mirror.time.values[0] == ds.time.values[0]
+        ):
+            start = np.searchsorted(ds.time.values, mirror.time.values[-1])
+            recent = ds.isel(time=slice(max(0, start - overlap + 1), None))
+            updated, added = upsert(store, recent)
+            print(f"Updated {len(updated)} and added {len(added)} dates in {target}.")
+            return
+        print(f"{target} doesn't match {source}, rebuilding it.")
+    write_encoded(
+        ds, store, chunks=MIRROR_CHUNKS, chunks_per_shard=MIRROR_CHUNKS_PER_SHARD
+    )
+    print(f"Created {target} with {ds.time.size} dates.")
+
+
+def update_mirrors(storage):
+    for source, target in MIRRORS.items():
+        if storage.zarr_exists(source):
+            update_mirror(storage, source, target)
+
+
+def open_timeseries(storage):
+    """The NDVI and forecast history as one dataset, with the forecast on its own time."""
+    ndvi = xr.open_zarr(storage.zarr_store(MIRRORS["ndvi_processed.zarr"]))
+    preds = xr.open_zarr(storage.zarr_store(MIRRORS["ndvi_predictions.zarr"]))
+    preds = preds.rename(time="forecast_time")
+    return xr.merge(
+        [ndvi["ndvi_8d_processed"], preds["ndvi_8d_forecast"]], join="exact"
+    )
+
+
+def to_frame(series):
+    """NDVI and forecast by date, dates without one of them are NaN."""
+    return pd.concat(
+        [
+            series["ndvi_8d_processed"].to_series().rename("ndvi"),
+            series["ndvi_8d_forecast"]
+            .to_series()
+            .rename("forecast")
+            .rename_axis("time"),
+        ],
+        axis=1,
+    )
+
+
+def pixel_series(ts, x, y):
+    """History of the pixel nearest to x, y in the CRS of the store."""
+    series = ts.sel(x=x, y=y, method="nearest").compute()
+    return to_frame(series.drop_vars(["x", "y", "spatial_ref"], errors="ignore"))
+
+
+def polygon_series(ts, geometry):
+    """Mean history of the pixels whose center is in a GeoJSON geometry.
+
+    The geometry must be in the CRS of the store. Needs rasterio.
+    """
+    from affine import Affine
+    from rasterio.features import bounds, geometry_mask
+
+    minx, miny, maxx, maxy = bounds(geometry)
+    dx = float(ts.x[1] - ts.x[0])
+    dy = float(ts.y[1] - ts.y[0])
+    window = ts.sel(
+        x=slice(minx, maxx), y=slice(maxy, miny) if dy < 0 else slice(miny, maxy)
+    )
+    if window.sizes["x"] and window.sizes["y"]:
+        transform = Affine.translation(
+            float(window.x[0]) - dx / 2, float(window.y[0]) - dy / 2
+        ) * Affine.scale(dx, dy)
+        inside = ~geometry_mask(
+            [geometry],
+            out_shape=(window.sizes["y"], window.sizes["x"]),
+            transform=transform,
+        )
+        window = window.where(xr.DataArray(inside, dims=("y", "x")))
+    return to_frame(window.mean(["y", "x"]).compute())
+
+
+if __name__ == "__main__":
+    # python -m vhm_common.timeseries, after ingest tiles run separately are finished
+    update_mirrors(storage_from_env())
@@ -0,0 +1,99 @@
+import numpy as np
+import xarray as xr
+import zarr
+
+from vhm_common.encoding import write_chunks
+
+
+def extend_dim(store, template, labels, dim="time", consolidated=True):
+    """Append labels along dim to the store without writing any chunks.
+
+    template has the variables to extend. Unwritten chunks read as the fill value, so
+    only the parts with data have to be written afterwards with region writes.
+    """
+    empty = xr.full_like(template.isel({dim: [-1] * len(labels)}), np.nan)
+    empty = empty.assign_coords({dim: labels}).drop_encoding().chunk()
+    # Only metadata and coordinates are written, the delayed chunk writes are discarded
+    empty.to_zarr(
+        store,
+        mode="a",
+        append_dim=dim,
+        compute=False,
+        safe_chunks=False,
+        consolidated=consolidated,
+    )
+
+
+def aligned_chunks(da, dim, start):
+    """Dask chunks for writing da at start along dim, with boundaries on the store grid.
+
+    Each chunk (or shard) of the store is then written by a single task in one piece.
+    """
+    chunks = write_chunks(da)
+    size = chunks[dim]
+    first = min(da.sizes[dim], size - start % size)
+    rest = da.sizes[dim] - first
+    return {
+        **chunks,
+        dim: (first,)
+        + (size,) * (rest // size)
+        + ((rest % size,) if rest % size else ()),
+    }
+
+
+def plan_upsert(existing, labels):
+    """Region in the extended store covered by labels and the labels to append."""
+    existing = np.asarray(existing)
+    labels = np.asarray(labels)
+    if np.any(labels[1:] <= labels[:-1]):
+        raise ValueError("Labels must be sorted and unique.")
+    new = labels[~np.isin(labels, existing)]
+    if len(existing) and len(new) and new[0] <= existing[-1]:
+        raise ValueError(
+            "New labels can only be added after the last label in the store."
+        )
+    extended = np.concatenate([existing, new])
+    start = (
+        len(extended) - len(labels)
+        if len(new)
+        else np.searchsorted(existing, labels[0])
+    )
+    if not np.array_equal(extended[start : start + len(labels)], labels):
+        raise ValueError("Labels must cover a contiguous range of the store.")
+    return slice(start, start + len(labels)), new
+
+
+def upsert(store, data, dim="time"):
+    """Overwrite the labels of data along dim that are in the store and append the others.
+
+    Everything is written in a single region write after the store is extended, with
+    consolidated metadata updated once at the end. Returns the updated and added labels.
+    An unnamed DataArray is written to the only data variable of the store.
+    """
+    ds = xr.open_zarr(store)
+    if isinstance(data, xr.DataArray):
+        if data.name is None and len(ds.data_vars) == 1:
+            data = data.rename(next(iter(ds.data_vars)))
+        data = data.to_dataset()
+    region, new = plan_upsert(ds[dim].values, data[dim].values)
+    if len(new):
+        extend_dim(store, ds[list(data.data_vars)], new, dim, consolidated=False)
+        ds = xr.open_zarr(store, consolidated=False)
+
+    data = data.drop_vars(
+        [name for name, var in data.variables.items() if dim not in var.dims]
+    ).drop_encoding()
+    for name, da in data.data_vars.items():
+        stored = ds[name]
+        da = da.transpose(*stored.dims)
+        if da.chunks is not None:
+            stored = stored.isel({dim: region})
+            da = da.chunk(aligned_chunks(stored, dim, region.start))
+        data[name] = da
+    data.to_zarr(
+        store, mode="r+", region={dim: region}, safe_chunks=False, consolidated=False
+    )
+    zarr.consolidate_metadata(store)
+
+    updated = data[dim].values[: len(data[dim]) - len(new)]
+    return updated, new
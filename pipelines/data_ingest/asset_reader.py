@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from odc.stac import configure_rio, load
+
+READ_CONCURRENCY = int(os.environ.get("READ_CONCURRENCY", 16))
+READ_PREFETCH = int(os.environ.get("READ_PREFETCH", 1))
+READ_RETRIES = int(os.environ.get("READ_RETRIES", 3))
+READ_BACKOFF = float(os.environ.get("READ_BACKOFF", 2.0))
+GDAL_OPTIONS = {
+    # Adjacent COG blocks are fetched with one range request
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    # GDAL retries single requests, AssetReader retries whole scenes
+    "GDAL_HTTP_MAX_RETRY": str(READ_RETRIES),
+    "GDAL_HTTP_RETRY_DELAY": str(READ_BACKOFF),
+}
+
+
+def configure_gdal():
+    configure_rio(cloud_defaults=True, **GDAL_OPTIONS)
+
+
+class SharedPool:
+    """Executor shared between loads. odc-stac shuts down the pool it is given on exit."""
+
+    def __init__(self, max_workers):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self.executor
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class AssetReader:
+    """Loads STAC items onto a geobox with a bounded number of concurrent reads.
+
+    All loads share one thread pool, so READ_CONCURRENCY limits the requests in flight
+    across every tile that uses the reader.
+    """
+
+    def __init__(
+        self,
+        bands,
+        patch_url=None,
+        concurrency=READ_CONCURRENCY,
+        retries=READ_RETRIES,
+        backoff=READ_BACKOFF,
+    ):
+        self.bands = bands
+        self.patch_url = patch_url
+        self.retries = retries
+        self.backoff = backoff
+        self.pool = SharedPool(concurrency)
+        self._lock = threading.Lock()
+        # Size of the decoded bands, not the compressed bytes transferred
+        self.bytes_decoded = 0
+        self.loads = 0
+        self._start = None
+        self._end = None
+
+    def load(self, items, geobox):
+        """Read the items into memory, retrying with exponential backoff."""
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                scenes = load(
+                    items,
+                    bands=self.bands,
+                    geobox=geobox,
+                    groupby="solar_day",
+                    pool=self.pool,
+                    patch_url=self.patch_url,
+                )
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2**attempt
+                print(f"Read failed ({e}), retrying in {delay:.0f} s.")
+                time.sleep(delay)
+
+        with self._lock:
+            self.bytes_decoded += scenes.nbytes
+            self.loads += 1
+            self._start = start if self._start is None else min(self._start, start)
+            self._end = time.perf_counter()
+        return scenes
+
+    def load_ahead(self, batches, geobox, prefetch=READ_PREFETCH):
+        """Yield (key, items, scenes) for each (key, items) batch.
+
+        Up to prefetch batches are read in the background while the caller works on the
+        current one.
+        """
+        batches = iter(batches)
+        with ThreadPoolExecutor(max_workers=prefetch + 1) as executor:
+            queue = deque()
+
+            def submit_next():
+                batch = next(batches, None)
+                if batch is not None:
+                    key, items = batch
+                    queue.append(
+                        (key, items, executor.submit(self.load, items, geobox))
+                    )
+
+            for _ in range(prefetch + 1):
+                submit_next()
+            while queue:
+                key, items, future = queue.popleft()
+                submit_next()
+                yield key, items, future.result()
+
+    def throughput(self):
+        if self._start is None:
+            return "No assets read."
+        seconds = self._end - self._start
+        mb = self.bytes_decoded / 1e6
+        return (
+            f"Read assets in {seconds:.1f} s, {mb:.1f} MB decoded "
+            f"({mb / seconds:.1f} decoded MB/s)."
+        )
@@ -0,0 +1,92 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from vhm_common.benchmark import (
+    BENCHMARK_RESOLUTION,
+    grid_size,
+    measure,
+    selected,
+    write_report,
+)
+from vhm_common.encoding import write_encoded
+
+from ndvi_pipeline import WINDOW, composite_window, fill_windows
+from synthetic_catalog import synthetic_bands
+
+NUM_WINDOWS = int(os.environ.get("BENCHMARK_WINDOWS", 6))
+SCENES_PER_WINDOW = 2
+
+
+def synthetic_scenes(size, window_date, rng):
+    """Landsat-like red, nir08 and qa_pixel scenes of one window, clouds are masked."""
+    times = [window_date + np.timedelta64(i, "D") for i in range(SCENES_PER_WINDOW)]
+    bands = [
+        synthetic_bands((size, size), pd.Timestamp(t).dayofyear, rng) for t in times
+    ]
+    return xr.Dataset(
+        {
+            band: (("time", "y", "x"), np.stack([b[band] for b in bands]))
+            for band in ("red", "nir08", "qa_pixel")
+        },
+        coords={"time": times},
+    )
+
+
+def main():
+    size = grid_size()
+    rng = np.random.default_rng(0)
+    state_date = np.datetime64("2024-01-01", "ns")
+    window_dates = state_date + WINDOW * np.arange(1, NUM_WINDOWS + 1)
+    scenes = [synthetic_scenes(size, date, rng) for date in window_dates]
+    print(f"Ingest benchmark of {NUM_WINDOWS} windows of {size} x {size} pixels.")
+    records = []
+
+    # The composites are the input of the other cases, so they are always computed
+    raw, record = measure(
+        "ingest",
+        "mask_ndvi_mvc",
+        lambda: xr.concat(
+            [
+                composite_window(s).expand_dims(time=[date])
+                for s, date in zip(scenes, window_dates)
+            ],
+            dim="time",
+        ),
+        size * size * NUM_WINDOWS * SCENES_PER_WINDOW,
+        resolution=BENCHMARK_RESOLUTION,
+    )
+    if selected("ingest", "mask_ndvi_mvc"):
+        records.append(record)
+
+    if selected("ingest", "gap_fill"):
+        state = xr.Dataset(
+            {"last_valid_ndvi": (("y", "x"), np.full((size, size), 0.2, np.float32))}
+        )
+        _, record = measure(
+            "ingest",
+            "gap_fill",
+            lambda: fill_windows(raw, state, state_date).compute(),
+            size * size * NUM_WINDOWS,
+            resolution=BENCHMARK_RESOLUTION,
+        )
+        records.append(record)
+
+    if selected("ingest", "write_store"):
+        ds = xr.Dataset({"ndvi_8d_raw": raw, "ndvi_8d_processed": raw})
+        with tempfile.TemporaryDirectory() as tmp:
+            _, record = measure(
+                "ingest",
+                "write_store",
+                lambda: write_encoded(ds, os.path.join(tmp, "ndvi_processed.zarr")),
+                size * size * NUM_WINDOWS,
+                resolution=BENCHMARK_RESOLUTION,
+            )
+        records.append(record)
+    write_report(records)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,307 @@
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, time
 
 import numpy as np
+import odc.geo.xr  # noqa: F401
+import pystac
 import pystac_client
-import s3fs
 import xarray as xr
-from dask.distributed import Client
 from dotenv import load_dotenv
-from odc.stac import load
-from planetary_computer import sign_url
-from shapely.geometry import shape
+from pystac_client.stac_api_io import StacApiIO
+from shapely.geometry import box, shape
+from vhm_common.encoding import (
+    as_stored,
+    dataset_encoding,
+    store_layout,
+    write_chunks,
+)
+from vhm_common.execution import dask_execution
+from vhm_common.instrument import count_requests_io, run_report
+from vhm_common.storage import storage_from_env
+from vhm_common.timeseries import MIRRORS, update_mirror
+from vhm_common.upsert import extend_dim
+
+from asset_reader import AssetReader, configure_gdal
 
 load_dotenv()
-BUCKET_NAME = os.environ["S3_BUCKET"]
-AOI_PATH = f"{BUCKET_NAME}/aoi.geojson"
-ZARR_PATH = f"{BUCKET_NAME}/ndvi_processed.zarr"
+AOI_PATH = "aoi.geojson"
+ZARR_PATH = "ndvi_processed.zarr"
+MANIFEST_DIR = "ndvi_processed_manifest"
+FILL_STATE_PATH = "ndvi_fill_state.zarr"
+PLAN_PATH = "ndvi_ingest_plan.json"
+# A STAC API, or the catalog.json of a static catalog such as a local test catalog
+STAC_URL = os.environ.get(
+    "STAC_URL", "https://planetarycomputer.microsoft.com/api/stac/v1/"
+)
+COLLECTION = "landsat-c2-l2"
+# "all" plans and ingests in one task, "plan" and "tile" split the work across tasks
+INGEST_MODE = os.environ.get("INGEST_MODE", "all")
+TILE_SIZE = int(os.environ.get("TILE_SIZE", 2048))
+TILE_INDEX = int(os.environ.get("TILE_INDEX", 0))
+TILE_COUNT = int(os.environ.get("TILE_COUNT", 1))
+TILE_WORKERS = int(os.environ.get("TILE_WORKERS", 4))
+WINDOW = np.timedelta64(8, "D")
+# Mask out nodata and cloud pixels
+# Bit 3 is cloud shadow, bit 4 is cloud, and bit 0 is nodata
+MASK_BITS = 0b00011001
 
 
-def main():
-    client = Client()
-    print(client)
+def store_chunks(ds):
+    # Spatial unit of writes to the store, a whole shard if the store is sharded
+    chunks = write_chunks(ds["ndvi_8d_raw"])
+    return {dim: chunks[dim] for dim in ("y", "x")}
 
-    fs = s3fs.S3FileSystem()
 
-    if fs.exists(AOI_PATH):
-        with fs.open(AOI_PATH, "r") as file:
-            area_of_interest = json.load(file)["features"][0]["geometry"]
-            geom = shape(area_of_interest)
-            bbox = tuple(geom.bounds)
-    else:
-        raise FileNotFoundError(f"{AOI_PATH} was not found.")
+def ndvi_max_composite(red, nir, qa):
+    """Fused cloud mask, NDVI and maximum-value composite over the last axis.
+
+    Takes the raw uint16 bands and only keeps one float32 scene and the running maximum
+    in memory, instead of the float64 masked copies of every band.
+    """
+    composite = np.full(red.shape[:-1], np.nan, dtype=np.float32)
+    for i in range(red.shape[-1]):
+        r = red[..., i].astype(np.float32)
+        n = nir[..., i].astype(np.float32)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ndvi = (n - r) / (n + r)
+        ndvi[(qa[..., i] & MASK_BITS) != 0] = np.nan
+        np.fmax(composite, np.clip(ndvi, -1, 1, out=ndvi), out=composite)
+    return composite
 
-    if fs.exists(f"{ZARR_PATH}/zarr.json"):
-        store = s3fs.S3Map(root=ZARR_PATH, s3=fs, check=False)
-        ds = xr.open_zarr(store)
-        start_date = ds.time[-1].values
-        print(f"Last 5 dates in {ZARR_PATH} before update: {ds.time.values[-5:]}")
-    else:
-        raise FileNotFoundError(f"{ZARR_PATH} was not found.")
 
-    catalog = pystac_client.Client.open(
-        "https://planetarycomputer.microsoft.com/api/stac/v1/"
+def composite_window(scenes):
+    """Maximum NDVI of the scenes in one window, computed chunk by chunk if lazy."""
+    if scenes.chunks:
+        scenes = scenes.chunk({"time": -1})
+    return xr.apply_ufunc(
+        ndvi_max_composite,
+        scenes.red,
+        scenes.nir08,
+        scenes.qa_pixel,
+        input_core_dims=[["time"], ["time"], ["time"]],
+        output_dtypes=[np.float32],
+        dask="parallelized",
     )
-    collection = "landsat-c2-l2"
-    bbox = bbox
-    end_date = datetime.combine(date.today(), time()).strftime("%Y-%m-%dT%H:%M:%SZ")
 
-    search = catalog.search(
-        collections=[collection],
-        bbox=bbox,
-        datetime=f"{start_date}/{end_date}",
+
+def window_dates(times, origin):
+    """Start date of the 8 day window each time falls in."""
+    origin = np.datetime64(origin, "ns")
+    times = np.asarray(times, dtype="datetime64[ns]")
+    return origin + (times - origin) // WINDOW * WINDOW
+
+
+def item_datetime(item):
+    return np.datetime64(item.datetime.replace(tzinfo=None), "ns")
+
+
+def group_by_window(items, origin):
+    """Yield (window start, items) for every 8 day window from origin to the last item.
+
+    Windows without items are yielded with an empty list so the time axis stays contiguous
+    with the store, whose next window starts at origin.
+    """
+    labels = window_dates([item_datetime(item) for item in items], origin)
+    start = np.datetime64(origin, "ns")
+    for window_date in np.arange(start, labels.max() + WINDOW, WINDOW):
+        yield (
+            window_date,
+            [item for item, label in zip(items, labels) if label == window_date],
+        )
+
+
+class IngestManifest:
+    """STAC item IDs already composited into each 8 day window of the Zarr store.
+
+    Each tile has its own manifest, saved after every window is written. Because the composite is a
+    maximum, folding the same items into a window twice gives the same result, so a run
+    that stopped between writing a window and saving the manifest can safely redo it.
+    """
+
+    def __init__(self, fs, path):
+        self.fs = fs
+        self.path = path
+        self.windows = {}
+        if fs.exists(path):
+            with fs.open(path, "r") as file:
+                manifest = json.load(file)
+            self.windows = {
+                window: set(item_ids)
+                for window, item_ids in manifest["windows"].items()
+            }
+
+    @staticmethod
+    def key(window_date):
+        return str(np.datetime64(window_date, "D"))
+
+    def unseen(self, window_date, items):
+        seen = self.windows.get(self.key(window_date), set())
+        return [item for item in items if item.id not in seen]
+
+    def add(self, window_date, items):
+        key = self.key(window_date)
+        self.windows.setdefault(key, set()).update(item.id for item in items)
+
+    def save(self):
+        manifest = {
+            "windows": {
+                window: sorted(item_ids) for window, item_ids in self.windows.items()
+            },
+        }
+        # A single object write, so the manifest is never left partially updated
+        with self.fs.open(self.path, "w") as file:
+            json.dump(manifest, file, indent=2)
+
+
+def init_fill_state(ds, state_date):
+    """Build the gap fill state from the processed window at state_date in the store.
+
+    Later runs only update the state, so the history is never read again.
+    """
+    last_valid_ndvi = (
+        ds["ndvi_8d_processed"].sel(time=state_date, drop=True).astype(np.float32)
     )
-    items = search.item_collection()
+    return xr.Dataset(
+        {
+            "last_valid_ndvi": last_valid_ndvi,
+            "filled_until": xr.full_like(
+                last_valid_ndvi,
+                np.datetime64(state_date, "ns"),
+                dtype="datetime64[ns]",
+            ),
+        }
+    )
+
+
+def fill_windows(raw, state, state_date):
+    """Gap fill the windows after the state date.
+
+    Gaps are filled backward from later windows and then forward from the last
+    filled value, the same as bfill("time").ffill("time") starting at the state date.
+    """
+    seed = state["last_valid_ndvi"].expand_dims(time=[np.datetime64(state_date, "ns")])
+    seed = seed.drop_vars(["y", "x", "spatial_ref"], errors="ignore")
+    raw = raw.drop_vars(["y", "x", "spatial_ref"], errors="ignore")
+    filled = xr.concat([seed, raw], dim="time").bfill("time").ffill("time")
+    return filled.isel(time=slice(1, None))
+
+
+def update_fill_state(state, raw, filled, state_date):
+    """Advance the gap fill state to state_date using the newly filled windows."""
+    raw = raw.sel(time=slice(None, state_date))
+    if raw.sizes["time"] == 0:
+        return state
+    return xr.Dataset(
+        {
+            "last_valid_ndvi": filled.sel(time=state_date, drop=True).astype(
+                np.float32
+            ),
+            "filled_until": xr.full_like(
+                state["filled_until"], np.datetime64(state_date, "ns")
+            ),
+        }
+    )
+
+
+def plan_tiles(ds, tile_size):
+    """Split the store grid into tiles made of whole Zarr chunks, or shards if sharded.
+
+    Tiles never share a chunk or shard, so each one can be written with region= independently.
+    """
+    chunks = store_chunks(ds)
+    steps = {dim: max(1, tile_size // chunks[dim]) * chunks[dim] for dim in ("y", "x")}
+    return [
+        {
+            "y": [y, min(y + steps["y"], ds.sizes["y"])],
+            "x": [x, min(x + steps["x"], ds.sizes["x"])],
+        }
+        for y in range(0, ds.sizes["y"], steps["y"])
+        for x in range(0, ds.sizes["x"], steps["x"])
+    ]
+
+
+def tile_region(tile):
+    return {dim: slice(*tile[dim]) for dim in ("y", "x")}
+
+
+def extend_time(store, ds, window_dates):
+    """Append empty windows to the store without writing any chunks.
+
+    Unwritten chunks read as NaN, so tiles only have to write the windows with data.
+    """
+    new_dates = [d for d in window_dates if d not in ds.get_index("time")]
+    if not new_dates:
+        return
+    extend_dim(store, ds[["ndvi_8d_raw", "ndvi_8d_processed"]], new_dates)
+    print(f"Dates added: {new_dates}")
+
+
+def search_items(stac_url, bbox, start_date, end_date, stac_io=None):
+    """Items in the collection intersecting bbox between start_date and end_date."""
+    if not stac_url.endswith(".json"):
+        catalog = pystac_client.Client.open(stac_url, stac_io=stac_io)
+        search = catalog.search(
+            collections=[COLLECTION],
+            bbox=bbox,
+            datetime=f"{start_date}/{end_date}",
+        )
+        return list(search.item_collection())
+
+    catalog = pystac.Catalog.from_file(stac_url)
+    catalog.make_all_asset_hrefs_absolute()
+    start_date = np.datetime64(start_date, "ns")
+    end_date = np.datetime64(end_date.rstrip("Z"), "ns")
+    return [
+        item
+        for item in catalog.get_items(recursive=True)
+        if item.collection_id == COLLECTION
+        and start_date <= item_datetime(item) <= end_date
+        and shape(item.geometry).intersects(box(*bbox))
+    ]
+
+
+def patch_url_for(stac_url):
+    # Only Planetary Computer assets need signed URLs
+    if "planetarycomputer" not in stac_url:
+        return None
+    from planetary_computer import sign_url
+
+    return sign_url
+
+
+def plan_ingest(storage, bbox, stac_io=None):
+    """Search for new items and prepare the stores so that tiles can be ingested independently.
+
+    The plan lists the items in every window and the tiles of the store grid.
+    """
+    store = storage.zarr_store(ZARR_PATH)
+    state_store = storage.zarr_store(FILL_STATE_PATH)
+    ds = xr.open_zarr(store)
+    print(f"Last 5 dates in {ZARR_PATH} before update: {ds.time.values[-5:]}")
+
+    if storage.zarr_exists(FILL_STATE_PATH):
+        # Start from the earliest window that is not filled in every tile, so a run
+        # where some tiles failed is picked up again
+        filled_until = xr.open_zarr(state_store)["filled_until"]
+        start_date = filled_until.min().values + WINDOW
+    else:
+        print(f"{FILL_STATE_PATH} was not found, creating it from {ZARR_PATH}.")
+        start_date = ds.time[-1].values
+        state = init_fill_state(ds, start_date - WINDOW).chunk(store_chunks(ds))
+        state.drop_encoding().to_zarr(
+            state_store,
+            mode="w",
+            encoding=dataset_encoding(state, **store_layout(ds["ndvi_8d_raw"])),
+        )
+
+    end_date = datetime.combine(date.today(), time()).strftime("%Y-%m-%dT%H:%M:%SZ")
+    items = search_items(STAC_URL, bbox, start_date, end_date, stac_io)
 
     if len(items) == 0:
         print("STAC search returned no items.")
-        exit()
+        return None
     else:
         unique_dates = sorted(
             set(
@@ -68,64 +313,235 @@ def main():
         )
         print(f"STAC search found {len(items)} items for dates {unique_dates}.")
 
-    new_data = load(
-        items,
-        bands=["red", "nir08", "qa_pixel"],
-        bbox=bbox,
-        chunks={"x": 2048, "y": 2048},
-        resolution=300,
-        groupby="solar_day",
-        patch_url=sign_url,
-    )
+    # Windows start at start_date so that the previous last time window is updated with any new data
+    windows = list(group_by_window(items, origin=start_date))
+    extend_time(store, ds, [window_date for window_date, _ in windows])
 
-    # Mask out nodata and cloud pixels
-    # Bit 3 is cloud shadow, bit 4 is cloud, and bit 0 is nodata
-    mask_bits = 0b00011001
+    plan = {
+        "windows": {
+            str(window_date): [item.to_dict() for item in window_items]
+            for window_date, window_items in windows
+        },
+        "tiles": plan_tiles(ds, TILE_SIZE),
+    }
+    with storage.open(PLAN_PATH, "w") as file:
+        json.dump(plan, file)
+    print(f"Planned {len(plan['tiles'])} tiles for {len(windows)} windows.")
+    return plan
 
-    mask = (new_data.qa_pixel & mask_bits) != 0
 
-    new_data = new_data.where(~mask, other=np.nan).drop_vars("qa_pixel")
+def tile_tail(ds, written, tail_steps):
+    """The last windows of each variable of a tile, as they read back from the store.
 
-    ndvi = (new_data.nir08 - new_data.red) / (new_data.nir08 + new_data.red)
-    new_data["ndvi"] = ndvi.clip(-1, 1)
-    new_data = new_data.drop_vars(["red", "nir08"])
-    new_data = new_data.compute()
+    written has the windows this run wrote to the tile, so only the others are read.
+    Variables with fewer steps than the others are NaN before their first window.
+    """
+    tail = {}
+    for name, steps in tail_steps.items():
+        da = ds[name].isel(time=slice(-steps, None)).transpose("time", "y", "x")
+        times = da.time.values
+        unwritten = [t for t in times if t not in written[name]]
+        read = dict(zip(unwritten, da.sel(time=unwritten).values))
+        values = np.stack([written[name].get(t, read.get(t)) for t in times])
+        tail[name] = as_stored(da.copy(data=values), ds[name].encoding)
+    return xr.Dataset(tail)
 
-    # origin=start_date so that the previous last time window is recomputed with any new data
-    eight_day = new_data.ndvi.resample(time="8D", origin=start_date).max()
 
-    new_data = xr.Dataset(
-        {
-            "ndvi_8d_raw": eight_day,
-            "ndvi_8d_processed": eight_day,
-        }
-    )
+def merge_tiles(ds, tiles, tails):
+    """The tails of the tiles as one dataset on the grid of the store."""
+    coords = {name: c for name, c in ds.coords.items() if "time" not in c.dims}
+    merged = {}
+    for name in tails[0].data_vars:
+        da = tails[0][name]
+        values = np.full((da.sizes["time"], ds.sizes["y"], ds.sizes["x"]), np.nan)
+        for tile, tail in zip(tiles, tails):
+            region = tile_region(tile)
+            values[:, region["y"], region["x"]] = tail[name].values
+        merged[name] = xr.DataArray(
+            values,
+            dims=("time", "y", "x"),
+            coords={**coords, "time": da.time.values},
+        )
+    return xr.Dataset(merged)
+
 
-    overlap = new_data.sel(time=slice(start_date, start_date))
+def ingest_tile(storage, plan, tile, reader, tail_steps=None):
+    """Composite, gap fill and write one tile of the store.
 
-    overlap.drop_vars(["y", "x", "spatial_ref"]).to_zarr(
-        store, mode="a", region={"time": slice(-1, None)}
+    With tail_steps, e.g. {"ndvi_8d_processed": 10}, returns the last windows of the
+    tile from memory instead of reading them back.
+    """
+    store = storage.zarr_store(ZARR_PATH)
+    state_store = storage.zarr_store(FILL_STATE_PATH)
+    region = tile_region(tile)
+    ds = xr.open_zarr(store).isel(region)
+    ds = ds.chunk(store_chunks(ds))
+    times = ds.get_index("time")
+    geobox = ds.odc.geobox
+    footprint = geobox.geographic_extent.geom
+    tile_key = f"{tile['y'][0]}_{tile['x'][0]}"
+    manifest = IngestManifest(
+        storage.fs, storage.path(f"{MANIFEST_DIR}/{tile_key}.json")
     )
-    print(f"Dates updated: {overlap.time.values}")
-    new = new_data.isel(time=slice(1, None))
-    new.to_zarr(store, mode="a", append_dim="time")
-    print(f"Dates added: {new.time.values}")
 
-    # Fill the newly added data using the last filled date
-    ds = xr.open_zarr(store)
-    last_filled_date = start_date - np.timedelta64(8, "D")
-    filled = (
-        ds["ndvi_8d_processed"]
-        .sel(time=slice(last_filled_date, None))
-        .bfill("time")
-        .ffill("time")
+    written = {"ndvi_8d_raw": {}, "ndvi_8d_processed": {}}
+    batches = []
+    for window, window_items in plan["windows"].items():
+        window_date = np.datetime64(window, "ns")
+        window_items = [pystac.Item.from_dict(item) for item in window_items]
+        window_items = [
+            item for item in window_items if shape(item.geometry).intersects(footprint)
+        ]
+        new_items = manifest.unseen(window_date, window_items)
+        if new_items:
+            batches.append((window_date, new_items))
+
+    # The scenes of the next window are read while the current one is composited and written.
+    # Region writes use mode="r+", which only writes chunks, so parallel tiles never write the
+    # same object. Each Zarr shard in a write is covered by a single dask chunk, so the partial
+    # shard writes along time are safe.
+    for window_date, new_items, scenes in reader.load_ahead(batches, geobox):
+        composite = composite_window(scenes).expand_dims(time=[window_date])
+        # Fold the new items into the existing composite for this window
+        existing = ds["ndvi_8d_raw"].sel(time=[window_date]).astype(np.float32)
+        composite = composite.copy(data=np.fmax(composite.values, existing.data))
+        if tail_steps:
+            composite = composite.load()
+            for name in written:
+                written[name][window_date] = (
+                    composite.isel(time=0).transpose("y", "x").values
+                )
+
+        i = times.get_loc(window_date)
+        window = xr.Dataset(
+            {
+                "ndvi_8d_raw": composite,
+                "ndvi_8d_processed": composite,
+            }
+        )
+        window.drop_vars(["y", "x", "spatial_ref"], errors="ignore").to_zarr(
+            store,
+            mode="r+",
+            region={"time": slice(i, i + 1), **region},
+            safe_chunks=False,
+        )
+        manifest.add(window_date, new_items)
+        manifest.save()
+        print(f"Tile {tile_key}: date updated: {window_date}")
+
+    # Fill every window after the state date. The state is only advanced after the
+    # filled windows are written, so a tile that stopped before filling is redone.
+    state = xr.open_zarr(state_store).isel(region).load()
+    state_date = state["filled_until"].values.min()
+    raw = (
+        ds["ndvi_8d_raw"].sel(time=slice(state_date + WINDOW, None)).astype(np.float32)
     )
-    filled.drop_vars(["y", "x", "spatial_ref"]).to_zarr(
-        store, mode="a", region={"time": slice(len(ds.time) - len(filled.time), None)}
+    filled = fill_windows(raw, state, state_date)
+    filled = filled.rename("ndvi_8d_processed").drop_encoding().chunk({"time": -1})
+    if tail_steps:
+        filled = filled.load()
+        for window_date in filled.time.values:
+            written["ndvi_8d_processed"][window_date] = (
+                filled.sel(time=window_date).transpose("y", "x").values
+            )
+    filled.to_zarr(
+        store,
+        mode="r+",
+        region={"time": slice(len(times) - len(filled.time), None), **region},
+        safe_chunks=False,
     )
-    print(f"Dates filled: {filled.time.values}")
-    print("Finished adding data to zarr store.")
+
+    # The last window stays open for new items, so the state stops one window before it
+    state = update_fill_state(state, raw, filled, times.values[-2])
+    state.drop_vars(["y", "x", "spatial_ref"], errors="ignore").to_zarr(
+        state_store, mode="r+", region=region
+    )
+    print(f"Tile {tile_key}: dates filled: {filled.time.values}")
+    if tail_steps:
+        return tile_tail(ds, written, tail_steps)
+
+
+def run(storage, report, tail_steps=None):
+    """Ingest the new scenes into the store.
+
+    With tail_steps, returns the last windows of the store as a dataset, e.g. for the
+    next stage of the fused pipeline, or None if there was nothing to ingest.
+    """
+    if storage.exists(AOI_PATH):
+        with storage.open(AOI_PATH, "r") as file:
+            area_of_interest = json.load(file)["features"][0]["geometry"]
+            geom = shape(area_of_interest)
+            bbox = tuple(geom.bounds)
+    else:
+        raise FileNotFoundError(f"{storage.path(AOI_PATH)} was not found.")
+
+    if not storage.zarr_exists(ZARR_PATH):
+        raise FileNotFoundError(f"{storage.path(ZARR_PATH)} was not found.")
+
+    if INGEST_MODE in ("all", "plan"):
+        stac_io = StacApiIO()
+        count_requests_io(stac_io.session, report, "stac")
+        with report.phase("plan"):
+            plan = plan_ingest(storage, bbox, stac_io)
+        if plan is None:
+            return None
+    elif INGEST_MODE == "tile":
+        with storage.open(PLAN_PATH, "r") as file:
+            plan = json.load(file)
+    else:
+        raise ValueError(f"Unknown INGEST_MODE: {INGEST_MODE}")
+
+    if INGEST_MODE in ("all", "tile"):
+        # Tiles write disjoint regions, so they run in parallel on the cluster and
+        # separate tasks only need to agree on TILE_INDEX and TILE_COUNT
+        tiles = plan["tiles"][TILE_INDEX::TILE_COUNT]
+        configure_gdal()
+        reader = AssetReader(
+            ["red", "nir08", "qa_pixel"], patch_url=patch_url_for(STAC_URL)
+        )
+        pixels = sum(
+            (tile["y"][1] - tile["y"][0]) * (tile["x"][1] - tile["x"][0])
+            for tile in tiles
+        )
+        with dask_execution(pixels * len(plan["windows"])) as mode:
+            with report.phase("tiles"):
+                with ThreadPoolExecutor(max_workers=TILE_WORKERS) as executor:
+                    futures = [
+                        executor.submit(
+                            ingest_tile, storage, plan, tile, reader, tail_steps
+                        )
+                        for tile in tiles
+                    ]
+                    tails = [future.result() for future in futures]
+                print(f"Finished adding {len(tiles)} tiles to zarr store.")
+                print(reader.throughput())
+            report.metrics.update(
+                tiles=len(tiles),
+                asset_loads=reader.loads,
+                asset_bytes_decoded=reader.bytes_decoded,
+                dask_execution=mode,
+            )
+
+            if INGEST_MODE == "all":
+                # With INGEST_MODE=tile, run python -m vhm_common.timeseries once all
+                # tiles finish
+                with report.phase("mirror"):
+                    update_mirror(storage, ZARR_PATH, MIRRORS[ZARR_PATH])
+
+    ds = xr.open_zarr(storage.zarr_store(ZARR_PATH))
     print(f"Last 5 dates in {ZARR_PATH} after update: {ds.time.values[-5:]}")
+    if tail_steps and INGEST_MODE == "all":
+        return merge_tiles(ds, tiles, tails)
+    return None
+
+
+def main():
+    storage = storage_from_env()
+    print(storage)
+    # Tile tasks run at the same time, so each has its own report
+    stage = f"ingest_tile{TILE_INDEX}" if INGEST_MODE == "tile" else "ingest"
+    with run_report(stage, storage) as report:
+        run(storage, report)
 
 
 if __name__ == "__main__":
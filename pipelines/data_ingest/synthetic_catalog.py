@@ -0,0 +1,101 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+import pystac
+import rasterio
+from odc.geo.geobox import GeoBox
+from shapely.geometry import box
+
+# Default grid roughly matching the area of interest at 300 m
+CRS = "EPSG:32630"
+BOUNDS = (600000, 1470000, 660000, 1530000)
+RESOLUTION = 300
+COLLECTION = "landsat-c2-l2"
+BANDS = ["red", "nir08", "qa_pixel"]
+
+
+def synthetic_bands(shape, day_of_year, rng):
+    """Landsat-like uint16 bands with a seasonal NDVI signal and random clouds."""
+    season = 0.15 + 0.1 * np.sin(2 * np.pi * (day_of_year - 180) / 365)
+    ndvi = np.clip(season + rng.normal(0, 0.05, shape), -1, 1)
+    red = rng.uniform(8000, 12000, shape)
+    nir = red * (1 + ndvi) / (1 - ndvi)
+    qa = np.where(rng.random(shape) < 0.2, 1 << 3 | 1 << 4, 1 << 6)
+    return {
+        "red": red.astype(np.uint16),
+        "nir08": np.clip(nir, 0, 65535).astype(np.uint16),
+        "qa_pixel": qa.astype(np.uint16),
+    }
+
+
+def write_cog(path, data, geobox, nodata):
+    profile = {
+        "driver": "COG",
+        "width": geobox.width,
+        "height": geobox.height,
+        "count": 1,
+        "dtype": data.dtype,
+        "crs": str(geobox.crs),
+        "transform": geobox.transform,
+        "nodata": nodata,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+
+
+def write_synthetic_catalog(root, dates, geobox=None, seed=0):
+    """Write a static STAC catalog with one item of synthetic COGs for each date.
+
+    Returns the path of catalog.json, which can be used as STAC_URL for ingest.
+    """
+    if geobox is None:
+        geobox = GeoBox.from_bbox(BOUNDS, crs=CRS, resolution=RESOLUTION)
+    rng = np.random.default_rng(seed)
+    catalog = pystac.Catalog(id="synthetic", description="Synthetic Landsat scenes")
+    geometry = box(*geobox.geographic_extent.boundingbox)
+
+    for date in dates:
+        item_datetime = datetime.fromisoformat(date).replace(tzinfo=timezone.utc)
+        item_id = f"synthetic_{item_datetime:%Y%m%dT%H%M%S}"
+        item_dir = os.path.join(root, item_id)
+        os.makedirs(item_dir, exist_ok=True)
+        item = pystac.Item(
+            id=item_id,
+            geometry=geometry.__geo_interface__,
+            bbox=list(geometry.bounds),
+            datetime=item_datetime,
+            properties={
+                "proj:epsg": geobox.crs.epsg,
+                "proj:shape": list(geobox.shape),
+                "proj:transform": list(geobox.transform)[:6],
+            },
+            collection=COLLECTION,
+        )
+        bands = synthetic_bands(geobox.shape, item_datetime.timetuple().tm_yday, rng)
+        for band in BANDS:
+            nodata = 1 if band == "qa_pixel" else 0
+            path = os.path.join(item_dir, f"{band}.tif")
+            write_cog(path, bands[band], geobox, nodata)
+            item.add_asset(
+                band,
+                pystac.Asset(
+                    href=path,
+                    media_type=pystac.MediaType.COG,
+                    roles=["data"],
+                    extra_fields={
+                        "raster:bands": [{"nodata": nodata, "data_type": "uint16"}]
+                    },
+                ),
+            )
+        catalog.add_item(item)
+
+    catalog.normalize_hrefs(root)
+    catalog.save(catalog_type=pystac.CatalogType.SELF_CONTAINED)
+    return os.path.join(root, "catalog.json")
+
+
+if __name__ == "__main__":
+    # python synthetic_catalog.py <output dir> <date> [<date> ...]
+    print(write_synthetic_catalog(sys.argv[1], sys.argv[2:]))
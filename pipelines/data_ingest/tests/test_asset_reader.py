@@ -0,0 +1,28 @@
+import numpy as np
+import xarray as xr
+
+import asset_reader
+from asset_reader import AssetReader
+
+
+def test_load_ahead_retries_and_keeps_order(monkeypatch):
+    calls = []
+
+    def flaky_load(items, **kwargs):
+        calls.append(items)
+        if len(calls) == 1:
+            raise RuntimeError("HTTP 503")
+        return xr.Dataset({"red": ("time", np.zeros(len(items), dtype=np.uint16))})
+
+    monkeypatch.setattr(asset_reader, "load", flaky_load)
+    reader = AssetReader(["red"], backoff=0)
+    batches = [(key, ["item"] * key) for key in range(1, 5)]
+
+    loaded = [
+        (key, scenes.sizes["time"])
+        for key, _, scenes in reader.load_ahead(batches, geobox=None, prefetch=2)
+    ]
+
+    assert loaded == [(1, 1), (2, 2), (3, 3), (4, 4)]
+    assert len(calls) == 5
+    assert reader.bytes_decoded == 2 * (1 + 2 + 3 + 4)
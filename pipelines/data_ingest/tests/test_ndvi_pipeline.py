@@ -0,0 +1,236 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from vhm_common.encoding import write_encoded
+
+from ndvi_pipeline import (
+    IngestManifest,
+    composite_window,
+    fill_windows,
+    group_by_window,
+    init_fill_state,
+    merge_tiles,
+    plan_tiles,
+    tile_region,
+    tile_tail,
+    update_fill_state,
+    window_dates,
+)
+
+
+def reference_composite(data, origin):
+    # xarray expression previously used in ndvi_pipeline.main()
+    mask_bits = 0b00011001
+    mask = (data.qa_pixel & mask_bits) != 0
+    data = data.where(~mask, other=np.nan).drop_vars("qa_pixel")
+    ndvi = (data.nir08 - data.red) / (data.nir08 + data.red)
+    ndvi = ndvi.clip(-1, 1)
+    return ndvi.resample(time="8D", origin=origin).max()
+
+
+def make_item(item_id, day):
+    return SimpleNamespace(
+        id=item_id, datetime=datetime(2020, 1, day, 10, 30, tzinfo=timezone.utc)
+    )
+
+
+@pytest.fixture
+def scenes():
+    ny, nx = 30, 40
+    t = pd.to_datetime(
+        [
+            "2020-01-01T10:30",
+            "2020-01-05T10:30",
+            "2020-01-10T10:30",
+            "2020-01-26T10:30",
+            "2020-01-31T10:30",
+        ]
+    )
+    rng = np.random.default_rng(0)
+    shape = (len(t), ny, nx)
+    red = rng.integers(0, 20000, shape, dtype=np.uint16)
+    nir = rng.integers(0, 20000, shape, dtype=np.uint16)
+    # Include nodata pixels where both bands are zero
+    red[:, :5, :5] = 0
+    nir[:, :5, :5] = 0
+    qa = rng.choice(np.array([0, 1, 8, 16, 2, 64], dtype=np.uint16), size=shape)
+    return xr.Dataset(
+        {
+            "red": (("time", "y", "x"), red),
+            "nir08": (("time", "y", "x"), nir),
+            "qa_pixel": (("time", "y", "x"), qa),
+        },
+        coords={"time": t, "y": np.arange(ny), "x": np.arange(nx)},
+    ).chunk({"time": 1, "y": 16, "x": 16})
+
+
+def test_composite_matches_xarray_expression(scenes):
+    origin = np.datetime64("2020-01-01")
+    expected = reference_composite(scenes, origin).dropna("time", how="all")
+
+    labels = window_dates(scenes.time.values, origin)
+    composites = [
+        composite_window(scenes.isel(time=labels == window_date)).expand_dims(
+            time=[window_date]
+        )
+        for window_date in np.unique(labels)
+    ]
+    result = xr.concat(composites, dim="time").compute()
+
+    assert result.dtype == np.float32
+    np.testing.assert_array_equal(result.time.values, expected.time.values)
+    np.testing.assert_allclose(
+        result.transpose(*expected.dims).values, expected.values, rtol=1e-6
+    )
+
+
+def test_group_by_window_keeps_empty_windows():
+    items = [make_item("a", 2), make_item("b", 5), make_item("c", 20)]
+    windows = list(group_by_window(items, origin=np.datetime64("2020-01-01")))
+
+    assert [str(np.datetime64(d, "D")) for d, _ in windows] == [
+        "2020-01-01",
+        "2020-01-09",
+        "2020-01-17",
+    ]
+    assert [[item.id for item in w] for _, w in windows] == [["a", "b"], [], ["c"]]
+
+
+def test_group_by_window_starts_at_origin():
+    items = [make_item("a", 18), make_item("b", 20)]
+    windows = list(group_by_window(items, origin=np.datetime64("2020-01-01")))
+
+    assert [str(np.datetime64(d, "D")) for d, _ in windows] == [
+        "2020-01-01",
+        "2020-01-09",
+        "2020-01-17",
+    ]
+    assert [[item.id for item in w] for _, w in windows] == [[], [], ["a", "b"]]
+
+
+def test_manifest_skips_ingested_items(tmp_path):
+    fs = fsspec.filesystem("file")
+    path = str(tmp_path / "manifest.json")
+    window_date = np.datetime64("2020-01-01", "ns")
+    items = [make_item("a", 2), make_item("b", 5)]
+
+    manifest = IngestManifest(fs, path)
+    assert manifest.unseen(window_date, items) == items
+    manifest.add(window_date, items[:1])
+    manifest.save()
+
+    reloaded = IngestManifest(fs, path)
+    assert [item.id for item in reloaded.unseen(window_date, items)] == ["b"]
+
+
+def test_fill_windows_uses_state_and_later_windows():
+    t = pd.date_range("2020-01-01", periods=6, freq="8D")
+    nan = np.nan
+    # One pixel per case: observed, filled backward, filled forward, never observed
+    raw = xr.DataArray(
+        np.array(
+            [
+                [0.1, 0.2, nan, nan],
+                [0.2, nan, nan, nan],
+                [0.3, 0.4, 0.5, nan],
+                [0.4, nan, nan, nan],
+                [nan, 0.6, nan, nan],
+                [0.6, nan, nan, nan],
+            ]
+        )[:, np.newaxis, :],
+        dims=("time", "y", "x"),
+        coords={"time": t, "y": [0], "x": np.arange(4)},
+        name="ndvi_8d_raw",
+    )
+    processed = raw.isel(time=slice(None, 3)).ffill("time")
+    ds = xr.Dataset({"ndvi_8d_raw": raw, "ndvi_8d_processed": processed})
+
+    state = init_fill_state(ds, t[2])
+
+    new = raw.isel(time=slice(3, None))
+    filled = fill_windows(new, state, t[2])
+    expected = np.array(
+        [
+            [0.4, 0.6, 0.5, nan],
+            [0.6, 0.6, 0.5, nan],
+            [0.6, 0.6, 0.5, nan],
+        ]
+    )
+    np.testing.assert_allclose(filled.values[:, 0, :], expected, rtol=1e-6)
+
+    state = update_fill_state(state, new, filled, t[4])
+    assert (state["filled_until"].values == np.datetime64(t[4], "ns")).all()
+    np.testing.assert_allclose(state["last_valid_ndvi"].values[0], expected[1])
+
+
+def test_plan_tiles_aligns_with_chunks():
+    ds = xr.Dataset(
+        {"ndvi_8d_raw": (("time", "y", "x"), np.zeros((3, 250, 230)))}
+    ).chunk({"time": 3, "y": 100, "x": 100})
+
+    tiles = plan_tiles(ds, tile_size=150)
+
+    assert len(tiles) == 9
+    assert tiles[0] == {"y": [0, 100], "x": [0, 100]}
+    assert tiles[-1] == {"y": [200, 250], "x": [200, 230]}
+    covered = np.zeros((250, 230), dtype=int)
+    for tile in tiles:
+        covered[slice(*tile["y"]), slice(*tile["x"])] += 1
+    assert (covered == 1).all()
+
+
+def test_plan_tiles_aligns_with_shards():
+    ds = xr.Dataset(
+        {"ndvi_8d_raw": (("time", "y", "x"), np.zeros((3, 250, 230)))}
+    ).chunk({"time": 3, "y": 100, "x": 100})
+    ds["ndvi_8d_raw"].encoding = {"chunks": (3, 100, 100), "shards": (3, 200, 200)}
+
+    tiles = plan_tiles(ds, tile_size=150)
+
+    assert tiles == [
+        {"y": [0, 200], "x": [0, 200]},
+        {"y": [0, 200], "x": [200, 230]},
+        {"y": [200, 250], "x": [0, 200]},
+        {"y": [200, 250], "x": [200, 230]},
+    ]
+
+
+def test_tile_tails_match_the_store(tmp_path):
+    store = str(tmp_path / "ndvi.zarr")
+    t = pd.date_range("2020-01-01", periods=5, freq="8D")
+    values = np.random.default_rng(0).uniform(0, 0.5, (5, 30, 20))
+    values[:, :4, :4] = np.nan
+    da = xr.DataArray(
+        values, dims=("time", "y", "x"), coords={"time": t, "y": -np.arange(30)}
+    )
+    write_encoded(xr.Dataset({"ndvi_8d_raw": da, "ndvi_8d_processed": da}), store)
+    ds = xr.open_zarr(store)
+    tail_steps = {"ndvi_8d_processed": 3, "ndvi_8d_raw": 2}
+
+    # Each tile writes new values of the last window, which are then not read back
+    tiles = [{"y": [0, 20], "x": [0, 20]}, {"y": [20, 30], "x": [0, 20]}]
+    tails = []
+    for tile in tiles:
+        region = tile_region(tile)
+        new = ds.isel({**region, "time": [-1]}).load() + 0.1
+        new.drop_vars("y").to_zarr(
+            store, mode="r+", region={"time": slice(4, 5), **region}
+        )
+        written = {name: {t[-1]: new[name].isel(time=0).values} for name in tail_steps}
+        tails.append(tile_tail(ds.isel(region), written, tail_steps))
+    tail = merge_tiles(ds, tiles, tails)
+
+    result = xr.open_zarr(store)
+    xr.testing.assert_identical(
+        tail["ndvi_8d_processed"],
+        result["ndvi_8d_processed"].isel(time=slice(-3, None)).load(),
+    )
+    xr.testing.assert_identical(
+        tail["ndvi_8d_raw"].isel(time=slice(-2, None)),
+        result["ndvi_8d_raw"].isel(time=slice(-2, None)).load(),
+    )
@@ -0,0 +1,52 @@
+import xarray as xr
+from vhm_common.encoding import as_stored
+from vhm_common.instrument import run_report
+from vhm_common.storage import storage_from_env
+
+import generate_cogs
+import inference_pipeline
+import ndvi_pipeline
+
+# Windows of each variable passed from ingest to the next stages, the lookback of the
+# forecast and the raw windows of the recent trend
+TAIL_STEPS = {
+    "ndvi_8d_processed": inference_pipeline.NUM_PAST_STEPS,
+    "ndvi_8d_raw": 4,
+}
+
+
+def run(storage):
+    """Ingest, forecast and write the trend COGs in this process.
+
+    Every stage still writes its stores, but the recent NDVI and the forecast are passed
+    to the next stage in memory instead of being read back. Each stage has its own run
+    report.
+    """
+    with run_report("fused_ingest", storage) as report:
+        ndvi = ndvi_pipeline.run(storage, report, TAIL_STEPS)
+    if ndvi is None:
+        print("No new windows were ingested, the next stages read the stores.")
+        lookback = None
+    else:
+        lookback = ndvi["ndvi_8d_processed"]
+    with run_report("fused_inference", storage) as report:
+        forecast = inference_pipeline.run(storage, report, lookback)
+    # The trends use the forecast as it was written to the store
+    pred_store = storage.zarr_store(inference_pipeline.PRED_ZARR_PATH)
+    encoding = xr.open_zarr(pred_store)["ndvi_8d_forecast"].encoding
+    with run_report("fused_generate_cogs", storage) as report:
+        generate_cogs.run(storage, report, ndvi, as_stored(forecast, encoding))
+
+
+def main():
+    if ndvi_pipeline.INGEST_MODE != "all" or ndvi_pipeline.TILE_COUNT != 1:
+        raise ValueError("The fused pipeline needs INGEST_MODE=all and TILE_COUNT=1.")
+    if not inference_pipeline.MODEL_KEY:
+        raise ValueError("MODEL_KEY must be set to the key of the model.")
+    storage = storage_from_env()
+    print(storage)
+    run(storage)
+
+
+if __name__ == "__main__":
+    main()
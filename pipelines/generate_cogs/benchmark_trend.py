@@ -0,0 +1,70 @@
+import tempfile
+import warnings
+
+import numpy as np
+from vhm_common.benchmark import (
+    BENCHMARK_RESOLUTION,
+    CRS,
+    grid_size,
+    measure,
+    selected,
+    synthetic_ndvi,
+    write_report,
+)
+from vhm_common.storage import Storage
+
+from cog_writer import write_cog
+from generate_cogs import (
+    calculate_slope,
+    classify,
+    classify_trend,
+    percent_missing,
+    trend_tile,
+)
+
+
+def main():
+    warnings.filterwarnings("ignore", category=np.exceptions.RankWarning)
+    size = grid_size()
+    recent = synthetic_ndvi(size, 3, missing=0.05).rio.write_crs(CRS).persist()
+    missing = percent_missing(recent).compute()
+    print(f"Trend benchmark of {size} x {size} pixels.")
+    records = []
+
+    def run(name, fn):
+        result, record = measure(
+            "trend", name, fn, size * size, resolution=BENCHMARK_RESOLUTION
+        )
+        records.append(record)
+        return result
+
+    expected = classes = None
+    if selected("trend", "polyfit_classify_trend"):
+        expected = run(
+            "polyfit_classify_trend",
+            lambda: classify_trend(
+                recent.isel(time=-1), calculate_slope(recent), missing
+            ).compute(),
+        )
+    if selected("trend", "classify"):
+        classes = run("classify", lambda: classify(recent, missing).compute())
+    if expected is not None and classes is not None:
+        # Pixels with a single value differ, polyfit returns an arbitrary slope for them
+        print(f"Matching classes: {float((classes == expected).mean()):.4%}")
+    if selected("trend", "write_cog"):
+        with tempfile.TemporaryDirectory() as tmp:
+            run(
+                "write_cog",
+                lambda: write_cog(
+                    Storage(tmp),
+                    "COG/trend.tif",
+                    missing,
+                    lambda tile: trend_tile(recent, missing, None, tile),
+                    tmp,
+                ),
+            )
+    write_report(records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+import tempfile
+from pathlib import Path
+
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+# Tiles are classified one at a time, so memory is bounded by the tile size. Tiles are
+# made of whole GeoTIFF blocks, so every block is written once.
+COG_TILE_SIZE = int(os.environ.get("COG_TILE_SIZE", 1024))
+BLOCK_SIZE = 512
+
+
+def tile_windows(height, width, tile_size=COG_TILE_SIZE):
+    for row in range(0, height, tile_size):
+        for col in range(0, width, tile_size):
+            yield Window(
+                col, row, min(tile_size, width - col), min(tile_size, height - row)
+            )
+
+
+def overview_factors(height, width, block_size=BLOCK_SIZE):
+    """Overview levels until the raster fits in a single block, like the COG driver."""
+    factors = []
+    factor = 2
+    while max(height, width) / (factor // 2) > block_size:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def write_tiled(path, template, classify_tile, tile_size=COG_TILE_SIZE):
+    """Write the int8 classes of every tile of template to a tiled GeoTIFF at path.
+
+    classify_tile is called with the y and x slices of a tile. Overviews are built by
+    GDAL from the written blocks.
+    """
+    template = template.transpose("y", "x")
+    height, width = template.shape
+    profile = {
+        "driver": "GTiff",
+        "height": height,
+        "width": width,
+        "count": 1,
+        "dtype": "int8",
+        "crs": template.rio.crs,
+        "transform": template.rio.transform(),
+        "tiled": True,
+        "blockxsize": BLOCK_SIZE,
+        "blockysize": BLOCK_SIZE,
+        "compress": "lzw",
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        for window in tile_windows(height, width, tile_size):
+            rows, cols = window.toslices()
+            classes = classify_tile({"y": rows, "x": cols})
+            dst.write(classes.transpose("y", "x").values, 1, window=window)
+        # Nearest keeps the overviews to valid classes
+        dst.build_overviews(overview_factors(height, width), Resampling.nearest)
+
+
+def write_cog(
+    storage, name, template, classify_tile, local_dir="/tmp", tile_size=COG_TILE_SIZE
+):
+    """Write the classes to a COG tile by tile and upload it to name in storage.
+
+    A COG has its overviews before the full resolution data, so the blocks are first
+    written to a tiled GeoTIFF and then copied into the COG layout.
+    """
+    with tempfile.TemporaryDirectory(dir=local_dir) as tmp:
+        tiled_path = Path(tmp) / "tiled.tif"
+        cog_path = Path(tmp) / Path(name).name
+        write_tiled(tiled_path, template, classify_tile, tile_size)
+        rasterio.shutil.copy(
+            tiled_path, cog_path, driver="COG", blocksize=BLOCK_SIZE, compress="lzw"
+        )
+        storage.upload(cog_path, name)
@@ -1,23 +1,30 @@
-import os
-from pathlib import Path
-
-import boto3
 import numpy as np
-import s3fs
+import rioxarray  # noqa: F401
 import xarray as xr
 from dotenv import load_dotenv
+from vhm_common.execution import dask_execution
+from vhm_common.instrument import run_report
+from vhm_common.pixel_mask import compact, load_valid_mask, pixel_index, scatter
+from vhm_common.storage import storage_from_env
+
+from cog_writer import write_cog
 
 load_dotenv()
-BUCKET_NAME = os.environ["S3_BUCKET"]
-NDVI_ZARR_PATH = f"{BUCKET_NAME}/ndvi_processed.zarr"
-PRED_ZARR_PATH = f"{BUCKET_NAME}/ndvi_predictions.zarr"
+NDVI_ZARR_PATH = "ndvi_processed.zarr"
+PRED_ZARR_PATH = "ndvi_predictions.zarr"
 NUM_FUTURE_STEPS = 3
 NUM_PAST_STEPS = 3
 RASTER_LOCAL_DIR = "/tmp"
 RASTER_PREFIX = "COG"
+PERCENT_MISSING_THRESH = 0.7
+NDVI_THRESH_BARE = 0.08  # based on typical NDVI for barren in this region
+NDVI_THRESH_PEAK = 0.26  # 95th percentile NDVI cropland/grassland in this region
+SLOPE_THRESH = 0.001  # tolerance for "no change"
+TIME_STEP = np.timedelta64(8, "D")
 
 
 def calculate_slope(da):
+    """Least squares slope per 8 days with polyfit, the reference for slope."""
     fit = da.polyfit(dim="time", deg=1)
     slope = fit.polyfit_coefficients.sel(degree=1)
     slope = (
@@ -31,80 +38,192 @@ def percent_missing(da):
 
 
 def classify_trend(last_timestep, slope, percent_missing):
-    # Thresholds
-    ndvi_thresh_bare = 0.08  # based on typical NDVI for barren in this region
-    ndvi_thresh_peak = 0.26  # 95th percentile NDVI cropland/grassland in this region
-    slope_thresh = 0.001  # tolerance for "no change"
-    percent_missing_thresh = 0.7
-
+    """Trend classes from a slope, the reference for classify."""
     # Start with all zeros. Represents bare/sparse vegetation
     classes = xr.full_like(last_timestep, fill_value=0, dtype=np.int8)
 
     # No change (NDVI > bare threshold slope near zero)
-    no_change_mask = (last_timestep > ndvi_thresh_bare) & (np.abs(slope) < slope_thresh)
+    no_change_mask = (last_timestep > NDVI_THRESH_BARE) & (np.abs(slope) < SLOPE_THRESH)
     classes = classes.where(~no_change_mask, 1)
 
     # Greening (NDVI > bare threshold and slope > 0)
-    greening_mask = (last_timestep > ndvi_thresh_bare) & (slope > slope_thresh)
+    greening_mask = (last_timestep > NDVI_THRESH_BARE) & (slope > SLOPE_THRESH)
     classes = classes.where(~greening_mask, 2)
 
     # Browning/senescence (NDVI > bare threshold and slope < 0)
-    browning_mask = (last_timestep > ndvi_thresh_bare) & (slope < -slope_thresh)
+    browning_mask = (last_timestep > NDVI_THRESH_BARE) & (slope < -SLOPE_THRESH)
     classes = classes.where(~browning_mask, 3)
 
     # Peak growth (NDVI > peak growth threshold)
-    peak_mask = last_timestep > ndvi_thresh_peak
+    peak_mask = last_timestep > NDVI_THRESH_PEAK
     classes = classes.where(~peak_mask, 4)
 
     # Don't classify trend if too much missing data
-    missing_mask = percent_missing > percent_missing_thresh
+    missing_mask = percent_missing > PERCENT_MISSING_THRESH
     classes = classes.where(~missing_mask, 5)
 
     return classes
 
 
-fs = s3fs.S3FileSystem()
-
-if fs.exists(f"{NDVI_ZARR_PATH}/zarr.json"):
-    ndvi_store = s3fs.S3Map(root=NDVI_ZARR_PATH, s3=fs, check=False)
-    ndvi = xr.open_zarr(ndvi_store)
+def slope_kernel(values, steps):
+    """Least squares slope along the last axis of values sampled at steps.
+
+    Closed form of a degree 1 fit that skips NaN, NaN where fewer than 2 values remain.
+    """
+    valid = ~np.isnan(values)
+    weights = valid.astype(values.dtype)
+    values = np.where(valid, values, 0)
+    n = weights.sum(axis=-1)
+    sum_t = weights @ steps
+    sum_tt = weights @ (steps * steps)
+    sum_y = values.sum(axis=-1)
+    sum_ty = values @ steps
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (n * sum_ty - sum_t * sum_y) / (n * sum_tt - sum_t * sum_t)
+    return np.where(n >= 2, slope, np.nan)
+
+
+def classify_kernel(values, percent_missing, steps):
+    """Trend class of each pixel in one pass, values has time on the last axis.
+
+    Same rules as classify_trend, where later rules take precedence.
+    """
+    slope = slope_kernel(values, steps)
+    last = values[..., -1]
+    vegetated = last > NDVI_THRESH_BARE
+    classes = np.select(
+        [
+            percent_missing > PERCENT_MISSING_THRESH,
+            last > NDVI_THRESH_PEAK,
+            vegetated & (slope < -SLOPE_THRESH),
+            vegetated & (slope > SLOPE_THRESH),
+            vegetated & (np.abs(slope) < SLOPE_THRESH),
+        ],
+        [5, 4, 3, 2, 1],
+        default=0,
+    )
+    return classes.astype(np.int8)
+
+
+def classify(recent, percent_missing):
+    """Trend classes as int8, computed chunk by chunk if recent is a dask array."""
+    steps = ((recent.time - recent.time[0]) / TIME_STEP).values.astype(np.float64)
+    if recent.chunks is not None:
+        recent = recent.chunk({"time": -1})
+    return xr.apply_ufunc(
+        classify_kernel,
+        recent,
+        percent_missing,
+        kwargs={"steps": steps},
+        input_core_dims=[["time"], []],
+        output_dtypes=[np.int8],
+        dask="parallelized",
+    )
+
+
+def classify_valid_pixels(recent, percent_missing, index):
+    """Classify the trend of the pixels in index only.
+
+    The other pixels are never above the bare threshold, so they are bare/sparse, or
+    insufficient data if too much is missing.
+    """
+    pixels = xr.DataArray(
+        compact(recent, index),
+        dims=("time", "pixel"),
+        coords={"time": recent.time.values},
+    )
+    classes = classify(
+        pixels, xr.DataArray(compact(percent_missing, index), dims="pixel")
+    )
+    percent_missing = percent_missing.transpose("y", "x")
+    grid = scatter(classes.values, index, percent_missing.shape, fill_value=0)
+    classes = percent_missing.copy(data=grid)
+    return classes.where(~(percent_missing > PERCENT_MISSING_THRESH), 5)
+
+
+def trend(recent, percent_missing, index=None):
+    if index is None:
+        return classify(recent, percent_missing)
+    return classify_valid_pixels(recent, percent_missing, index)
+
+
+def trend_tile(recent, percent_missing, valid, tile):
+    """Trend classes of one tile, only the tile is read and computed."""
+    recent = recent.isel(tile).load()
+    percent_missing = percent_missing.isel(tile).compute()
+    index = None if valid is None else pixel_index(valid.isel(tile))
+    return trend(recent, percent_missing, index)
+
+
+def run(storage, report, ndvi=None, preds=None):
+    """Write the recent and forecasted trend COGs.
+
+    ndvi (the recent windows) and preds (the latest forecast) are read from the stores
+    unless they are already in memory, e.g. in the fused pipeline.
+    """
+    if ndvi is None:
+        if storage.zarr_exists(NDVI_ZARR_PATH):
+            ndvi = xr.open_zarr(storage.zarr_store(NDVI_ZARR_PATH))
+        else:
+            raise FileNotFoundError(f"{storage.path(NDVI_ZARR_PATH)} was not found.")
     ndvi_processed = ndvi.ndvi_8d_processed
     ndvi_raw = ndvi.ndvi_8d_raw
-else:
-    raise FileNotFoundError(f"{NDVI_ZARR_PATH} was not found.")
-
-if fs.exists(f"{PRED_ZARR_PATH}/zarr.json"):
-    pred_store = s3fs.S3Map(root=PRED_ZARR_PATH, s3=fs, check=False)
-    preds = xr.open_zarr(pred_store).ndvi_8d_forecast
-else:
-    raise FileNotFoundError(f"{PRED_ZARR_PATH} was not found.")
-
-s3 = boto3.client("s3")
-
-# Recent Trend
-ndvi_recent = ndvi_processed.isel(time=slice(-4, -1))
-ndvi_last = ndvi_recent.isel(time=-1)
-ndvi_recent_raw = ndvi_raw.isel(time=slice(-4, -1))
-recent_percent_missing = percent_missing(ndvi_recent_raw)
-
-slope = calculate_slope(ndvi_recent)
-recent_trend = classify_trend(ndvi_last, slope, recent_percent_missing)
-
-raster_name = "ndvi_recent_trend.tif"
-raster_path = Path(RASTER_LOCAL_DIR) / raster_name
-recent_trend.rio.to_raster(raster_path=raster_path, driver="COG")
-s3.upload_file(raster_path, BUCKET_NAME, f"{RASTER_PREFIX}/{raster_name}")
-print("Created recent trend raster.")
-
-# Forecasted Trend
-pred_recent = preds.isel(time=slice(-3, None))
-pred_last = pred_recent.isel(time=-1)
-
-slope = calculate_slope(pred_recent)
-forecast_trend = classify_trend(pred_last, slope, recent_percent_missing)
-
-raster_name = "ndvi_forecast_trend.tif"
-raster_path = Path(RASTER_LOCAL_DIR) / raster_name
-forecast_trend.rio.to_raster(raster_path=raster_path, driver="COG")
-s3.upload_file(raster_path, BUCKET_NAME, f"{RASTER_PREFIX}/{raster_name}")
-print("Created forecasted trend raster.")
+
+    if preds is None:
+        if storage.zarr_exists(PRED_ZARR_PATH):
+            pred_store = storage.zarr_store(PRED_ZARR_PATH)
+            preds = xr.open_zarr(pred_store).ndvi_8d_forecast
+        else:
+            raise FileNotFoundError(f"{storage.path(PRED_ZARR_PATH)} was not found.")
+
+    valid = load_valid_mask(storage, ndvi)
+    if valid is None:
+        print("Valid pixel mask was not found or is outdated, classifying every pixel.")
+    else:
+        print(f"Classifying {float(valid.mean()):.1%} of pixels.")
+        report.metrics["valid_pixels"] = int(valid.sum())
+
+    # Recent Trend
+    ndvi_recent = ndvi_processed.isel(time=slice(-4, -1))
+    ndvi_recent_raw = ndvi_raw.isel(time=slice(-4, -1))
+    recent_percent_missing = percent_missing(ndvi_recent_raw)
+    pred_recent = preds.isel(time=slice(-3, None))
+
+    pixels = ndvi_recent.size + ndvi_recent_raw.size + pred_recent.size
+    with dask_execution(pixels) as mode:
+        report.metrics["dask_execution"] = mode
+        with report.phase("recent_trend"):
+            write_cog(
+                storage,
+                f"{RASTER_PREFIX}/ndvi_recent_trend.tif",
+                recent_percent_missing,
+                lambda tile: trend_tile(
+                    ndvi_recent, recent_percent_missing, valid, tile
+                ),
+                RASTER_LOCAL_DIR,
+            )
+            print("Created recent trend raster.")
+
+        # Forecasted Trend
+        with report.phase("forecast_trend"):
+            write_cog(
+                storage,
+                f"{RASTER_PREFIX}/ndvi_forecast_trend.tif",
+                recent_percent_missing,
+                lambda tile: trend_tile(
+                    pred_recent, recent_percent_missing, valid, tile
+                ),
+                RASTER_LOCAL_DIR,
+            )
+            print("Created forecasted trend raster.")
+
+
+def main():
+    storage = storage_from_env()
+    print(storage)
+    with run_report("generate_cogs", storage) as report:
+        run(storage, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import numpy as np
+import rasterio
+import rioxarray  # noqa: F401
+import xarray as xr
+from vhm_common.storage import Storage
+
+from cog_writer import write_cog
+
+
+def test_write_cog(tmp_path):
+    ny, nx = 1300, 1100
+    classes = xr.DataArray(
+        np.random.default_rng(0).integers(0, 6, (ny, nx), dtype=np.int8),
+        dims=("y", "x"),
+        coords={"y": 4e6 - 30 * np.arange(ny), "x": 5e5 + 30 * np.arange(nx)},
+    ).rio.write_crs("EPSG:32613")
+    tiles = []
+
+    def classify_tile(tile):
+        tiles.append(tile)
+        return classes.isel(tile)
+
+    storage = Storage(str(tmp_path / "bucket"))
+    write_cog(
+        storage, "COG/classes.tif", classes, classify_tile, tmp_path, tile_size=512
+    )
+
+    assert len(tiles) == 9
+    with rasterio.open(storage.path("COG/classes.tif")) as src:
+        np.testing.assert_array_equal(src.read(1), classes.values)
+        assert src.crs == classes.rio.crs
+        assert src.transform == classes.rio.transform()
+        assert src.overviews(1) == [2, 4]
+        assert src.tags(ns="IMAGE_STRUCTURE")["LAYOUT"] == "COG"
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from generate_cogs import (
+    calculate_slope,
+    classify,
+    classify_trend,
+    percent_missing,
+    slope_kernel,
+    trend,
+)
+
+
+def recent_ndvi(ny=40, nx=50, seed=0):
+    rng = np.random.default_rng(seed)
+    # Small changes between steps so every class occurs
+    start = rng.uniform(-0.1, 0.4, (1, ny, nx))
+    data = start + np.cumsum(rng.normal(0, 0.003, (3, ny, nx)), axis=0)
+    data[rng.random(data.shape) < 0.1] = np.nan
+    data[:, :5, :5] = np.nan
+    return xr.DataArray(
+        data,
+        dims=("time", "y", "x"),
+        coords={
+            "time": pd.date_range("2024-01-01", periods=3, freq="8D"),
+            "y": np.arange(ny),
+            "x": np.arange(nx),
+        },
+    )
+
+
+def test_slope_matches_polyfit():
+    ndvi = recent_ndvi()
+    steps = np.arange(3, dtype=np.float64)
+    slope = slope_kernel(ndvi.transpose("y", "x", "time").values, steps)
+
+    expected = calculate_slope(ndvi).values
+    # polyfit also returns a slope for a single value, which is never used
+    fitted = ndvi.count("time").values >= 2
+    np.testing.assert_allclose(slope[fitted], expected[fitted], atol=1e-12)
+    assert np.isnan(slope[~fitted]).all()
+
+
+def test_classify_matches_classify_trend():
+    ndvi = recent_ndvi()
+    ndvi = ndvi.where(ndvi.count("time") != 1)
+    missing = percent_missing(ndvi)
+
+    expected = classify_trend(ndvi.isel(time=-1), calculate_slope(ndvi), missing)
+    classes = classify(ndvi.chunk({"time": 1, "y": 16, "x": 16}), missing)
+
+    assert classes.dtype == np.int8
+    assert set(np.unique(expected.values)) == {0, 1, 2, 3, 4, 5}
+    xr.testing.assert_equal(classes.compute(), expected.drop_vars(["time", "degree"]))
+
+
+def test_trend_valid_pixels():
+    ndvi = recent_ndvi()
+    ndvi = ndvi.where(ndvi.count("time") != 1)
+    missing = percent_missing(ndvi)
+    index = np.flatnonzero((ndvi > 0.08).any("time").values)
+
+    np.testing.assert_array_equal(
+        trend(ndvi, missing, index).values, trend(ndvi, missing).values
+    )
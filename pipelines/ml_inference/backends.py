@@ -0,0 +1,146 @@
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+# "torchscript" is the fp32 reference. "torchscript-int8" is exported with dynamic int8
+# quantization of the LSTM by ml_dev/create_torchscript.py, "onnx" runs the same model in
+# ONNX Runtime and "onnx-int8" is its dynamic int8 quantization. "auto" uses the fastest.
+BACKENDS = ("torchscript", "torchscript-int8", "onnx", "onnx-int8")
+PARITY_TOLERANCE = float(os.environ.get("PARITY_TOLERANCE", 0.01))
+BENCHMARK_SIZE = int(os.environ.get("BENCHMARK_SIZE", 4096))
+
+
+def artifact_key(model_key, backend):
+    """Key of the exported model for a backend, next to the TorchScript model."""
+    path = Path(model_key)
+    if backend == "torchscript-int8":
+        return str(path.with_name(f"{path.stem}_int8{path.suffix}"))
+    if backend in ("onnx", "onnx-int8"):
+        return str(path.with_suffix(".onnx"))
+    return model_key
+
+
+def load_torchscript(path):
+    import torch
+
+    model = torch.jit.load(path, map_location="cpu")
+    model.eval()
+    return model
+
+
+def export_onnx(model, path, num_steps):
+    import torch
+
+    torch.onnx.export(
+        model,
+        (torch.zeros(1, num_steps, 1),),
+        path,
+        input_names=["past_steps"],
+        output_names=["forecast"],
+        dynamic_axes={"past_steps": {0: "batch", 1: "time"}, "forecast": {0: "batch"}},
+        dynamo=False,
+    )
+
+
+def quantize_onnx(path, quantized_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8)
+
+
+class OnnxModel:
+    """ONNX Runtime session that is called like the TorchScript model."""
+
+    def __init__(self, path):
+        import onnxruntime
+        import torch
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, past_steps):
+        import torch
+
+        output = self.session.run(None, {self.input_name: past_steps.numpy()})[0]
+        return torch.from_numpy(output)
+
+
+def load_backends(
+    names, storage, model_key, reference, num_steps, local_dir="/tmp", required=True
+):
+    """Models for the backends in names, with the TorchScript reference first.
+
+    ONNX models are exported from the reference if there is no exported file. A backend
+    that can't be loaded raises if required, otherwise it is left out.
+    """
+    models = {"torchscript": reference}
+    onnx_path = str(Path(local_dir) / Path(artifact_key(model_key, "onnx")).name)
+    for name in names:
+        if name in models:
+            continue
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown inference backend: {name}")
+        try:
+            if name == "torchscript-int8":
+                path = Path(local_dir) / Path(artifact_key(model_key, name)).name
+                storage.download(artifact_key(model_key, name), path)
+                models[name] = load_torchscript(path)
+                continue
+            if not Path(onnx_path).exists():
+                try:
+                    storage.download(artifact_key(model_key, "onnx"), onnx_path)
+                except FileNotFoundError:
+                    export_onnx(reference, onnx_path, num_steps)
+            if name == "onnx-int8":
+                quantized_path = onnx_path.replace(".onnx", "_int8.onnx")
+                quantize_onnx(onnx_path, quantized_path)
+                models[name] = OnnxModel(quantized_path)
+            else:
+                models[name] = OnnxModel(onnx_path)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"Backend {name} is not available: {e}")
+            if required:
+                raise
+    return models
+
+
+def select_backend(models, forecast_fn, sample, preferred="auto"):
+    """Check each model against the reference on sample and pick one.
+
+    A model is only used if its forecasts are within PARITY_TOLERANCE of the reference.
+    With preferred="auto" the fastest of those is used, otherwise the preferred backend.
+    """
+    results = {}
+    for name, model in models.items():
+        forecast_fn(model, sample[:1])  # warm up
+        start = time.perf_counter()
+        result = forecast_fn(model, sample)
+        seconds = time.perf_counter() - start
+        difference = (
+            float(np.nanmax(np.abs(result - results["torchscript"][0]), initial=0))
+            if results
+            else 0.0
+        )
+        results[name] = (result, seconds, difference)
+        print(
+            f"Backend {name}: {len(sample) / seconds:.0f} pixels/s, "
+            f"max difference {difference:.2g}."
+        )
+
+    passed = [
+        name for name, (_, _, diff) in results.items() if diff <= PARITY_TOLERANCE
+    ]
+    if preferred == "auto":
+        name = min(passed, key=lambda name: results[name][1])
+    elif preferred in passed:
+        name = preferred
+    else:
+        print(f"Backend {preferred} failed the parity check, using torchscript.")
+        name = "torchscript"
+    return name, models[name]
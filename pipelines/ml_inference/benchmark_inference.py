@@ -0,0 +1,85 @@
+import os
+import tempfile
+
+import torch
+from vhm_common.benchmark import (
+    BENCHMARK_RESOLUTION,
+    grid_size,
+    measure,
+    selected,
+    synthetic_ndvi,
+    write_report,
+)
+from vhm_common.execution import execution_mode
+
+from backends import load_torchscript
+from inference_pipeline import (
+    NUM_FUTURE_STEPS,
+    NUM_PAST_STEPS,
+    forecast_batched,
+    forecast_dask,
+)
+
+# A model made by ml_dev/create_torchscript.py, or an untrained LSTM of the same size
+MODEL_PATH = os.environ.get("BENCHMARK_MODEL_PATH")
+
+
+class SyntheticLSTM(torch.nn.Module):
+    def __init__(self, hidden_size=32):
+        super().__init__()
+        self.lstm = torch.nn.LSTM(1, hidden_size, batch_first=True)
+        self.head = torch.nn.Linear(hidden_size, NUM_FUTURE_STEPS)
+
+    def forward(self, past_steps):
+        _, (hidden, _) = self.lstm(past_steps)
+        return self.head(hidden[-1]).unsqueeze(-1)
+
+
+def benchmark_model(path):
+    torch.manual_seed(0)
+    model = SyntheticLSTM().eval()
+    torch.jit.trace(model, torch.zeros(1, NUM_PAST_STEPS, 1)).save(path)
+
+
+def main():
+    size = grid_size()
+    lookback = synthetic_ndvi(size, NUM_PAST_STEPS).compute()
+    valid = lookback.notnull().all("time")
+    print(f"Inference benchmark of {size} x {size} pixels.")
+    records = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = MODEL_PATH
+        if model_path is None:
+            model_path = os.path.join(tmp, "model.pt")
+            benchmark_model(model_path)
+
+        if selected("inference", "forecast_batched"):
+            models = {"torchscript": load_torchscript(model_path)}
+            _, record = measure(
+                "inference",
+                "forecast_batched",
+                lambda: forecast_batched(lookback, valid, models),
+                size * size,
+                resolution=BENCHMARK_RESOLUTION,
+                threads=torch.get_num_threads(),
+            )
+            records.append(record)
+
+        if selected("inference", "forecast_dask"):
+            # forecast() in dask tasks, including the start of a cluster if the
+            # execution (DASK_EXECUTION) uses one
+            _, record = measure(
+                "inference",
+                "forecast_dask",
+                lambda: forecast_dask(lookback, valid, model_path),
+                size * size,
+                resolution=BENCHMARK_RESOLUTION,
+                execution=execution_mode(int(valid.sum()) * NUM_PAST_STEPS),
+            )
+            records.append(record)
+    write_report(records)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,144 +1,365 @@
+import functools
+import hashlib
+import json
 import os
+import time
 
-import boto3
 import numpy as np
 import pandas as pd
-import s3fs
-import torch
 import xarray as xr
-from botocore.exceptions import ClientError
 from dask.diagnostics import ProgressBar
-from dask.distributed import Client, get_worker
 from dotenv import load_dotenv
+from vhm_common.encoding import CHUNKS, ndvi_encoding
+from vhm_common.execution import dask_execution
+from vhm_common.instrument import run_report
+from vhm_common.pixel_mask import (
+    compact,
+    load_valid_mask,
+    pixel_index,
+    scatter,
+    update_valid_mask,
+)
+from vhm_common.storage import storage_from_env
+from vhm_common.timeseries import MIRRORS, update_mirror
+from vhm_common.upsert import upsert
+
+from backends import (
+    BACKENDS,
+    BENCHMARK_SIZE,
+    load_backends,
+    load_torchscript,
+    select_backend,
+)
 
 load_dotenv()
-BUCKET_NAME = os.environ["S3_BUCKET"]
-NDVI_ZARR_PATH = f"{BUCKET_NAME}/ndvi_processed.zarr"
-PRED_ZARR_PATH = f"{BUCKET_NAME}/ndvi_predictions.zarr"
-MODEL_KEY = os.environ["MODEL_KEY"]
+NDVI_ZARR_PATH = "ndvi_processed.zarr"
+PRED_ZARR_PATH = "ndvi_predictions.zarr"
+FINGERPRINT_PATH = "ndvi_forecast_fingerprints.json"
+MODEL_KEY = os.environ.get("MODEL_KEY")
 MODEL_LOCAL_PATH = "/tmp/model.pt"
 NUM_FUTURE_STEPS = 3
 NUM_PAST_STEPS = 10
+# "batch" runs the model in this process on large batches of pixels, "dask" runs it in
+# dask tasks of DASK_CHUNK_SIZE x DASK_CHUNK_SIZE pixels
+INFERENCE_MODE = os.environ.get("INFERENCE_MODE", "batch")
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", 65536))
+# Model backend for batch mode, see backends.py. Dask mode always uses TorchScript.
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torchscript")
+DASK_CHUNK_SIZE = 10
+# Only forecast blocks of pixels whose lookback changed since the previous run
+INCREMENTAL = os.environ.get("INCREMENTAL", "true").lower() == "true"
+FINGERPRINT_BLOCK_SIZE = CHUNKS["y"]
 
 
-def load_model_on_worker(model_path, dask_worker, device="cpu"):
-    if not hasattr(dask_worker, "model"):
-        dask_worker.model = torch.jit.load(model_path, map_location=device)
-        dask_worker.model.eval()
+@functools.cache
+def cached_model(model_path):
+    """The TorchScript model, loaded once per process, e.g. once per dask worker."""
+    return load_torchscript(model_path)
 
 
-def forecast(chunk):
-    worker = get_worker()
+def forecast(chunk, valid, model_path):
     y_chunk, x_chunk = chunk.shape[0], chunk.shape[1]  # chunk shape: [y, x, time]
-    stacked = chunk.reshape(-1, chunk.shape[2])
+    result = np.full((y_chunk * x_chunk, NUM_FUTURE_STEPS), np.nan, dtype=np.float32)
+    valid = valid.ravel()
+    if not valid.any():
+        return result.reshape(y_chunk, x_chunk, NUM_FUTURE_STEPS)
+    import torch
+
+    stacked = chunk.reshape(-1, chunk.shape[2])[valid]
     past_steps = torch.tensor(stacked[..., np.newaxis], dtype=torch.float32)
     mean = past_steps.mean(dim=1, keepdim=True)
     std = past_steps.std(dim=1, keepdim=True)
     past_steps_normalized = (past_steps - mean) / (std + 1e-12)
-    output = worker.model(past_steps_normalized)
+    output = cached_model(model_path)(past_steps_normalized)
     output_denormalized = (output * std + mean).squeeze(-1)
-    forecast_steps = output_denormalized.shape[1]
-    return (
-        output_denormalized.reshape(y_chunk, x_chunk, forecast_steps).detach().numpy()
-    )
-
+    result[valid] = output_denormalized.detach().numpy()
+    return result.reshape(y_chunk, x_chunk, NUM_FUTURE_STEPS)
 
-def index_slice_for_time(ds, start, end):
-    idx = ds.get_index("time")
-    i0 = idx.get_loc(start)
-    i1 = idx.get_loc(end)
-    return slice(i0, i1 + 1)
 
+def forecast_pixels(model, sequences, batch_size=BATCH_SIZE):
+    """Forecast (pixels, time) sequences in batches of batch_size sequences.
 
-def update_zarr_store(store, data):
-    ds = xr.open_zarr(store)
-    overlap_dates = np.intersect1d(ds["time"].values, data["time"].values)
-    if overlap_dates.size > 0:
-        updated = data.sel(time=overlap_dates)
-        updated_slice = index_slice_for_time(
-            ds, overlap_dates.min(), overlap_dates.max()
-        )
-        updated.drop_vars(["y", "x", "spatial_ref"], errors="ignore").to_zarr(
-            store,
-            mode="a",
-            region={"time": updated_slice},
-        )
-        print(f"Dates updated: {updated['time'].values}")
+    The input batch is allocated once and reused, and the results are written into a
+    preallocated output array.
+    """
+    # torch is slow to import, so it is only imported when there is something to forecast
+    import torch
 
-    new = data.sel(time=~data["time"].isin(overlap_dates))
-    new.to_zarr(store, mode="a", append_dim="time")
-    print(f"Dates added: {new['time'].values}")
+    num_pixels, num_steps = sequences.shape
+    batch = torch.empty((min(batch_size, num_pixels), num_steps, 1))
+    result = None
+    with torch.inference_mode():
+        for start in range(0, num_pixels, batch_size):
+            stop = min(start + batch_size, num_pixels)
+            past_steps = batch[: stop - start]
+            past_steps.copy_(torch.from_numpy(sequences[start:stop, :, np.newaxis]))
+            mean = past_steps.mean(dim=1, keepdim=True)
+            std = past_steps.std(dim=1, keepdim=True)
+            past_steps.sub_(mean).div_(std + 1e-12)
+            output = model(past_steps)
+            output = (output * std + mean).squeeze(-1)
+            if result is None:
+                result = np.empty((num_pixels, output.shape[1]), dtype=np.float32)
+            result[start:stop] = output.numpy()
+    return result
 
 
-def main():
-    client = Client()
-    print(client)
+def forecast_batched(lookback, valid, models):
+    """Forecast the valid pixels of the lookback in this process, others are NaN.
 
-    fs = s3fs.S3FileSystem()
+    With more than one model, the backend is chosen on a sample of the pixels.
+    """
+    index = pixel_index(valid)
+    if len(index) == 0:
+        print("No pixels to forecast.")
+        return xr.DataArray(
+            np.full((NUM_FUTURE_STEPS, *valid.shape), np.nan, dtype=np.float32),
+            dims=("forecast_time", "y", "x"),
+            coords=lookback.isel(time=0, drop=True).coords,
+        )
+    import torch
 
-    if fs.exists(f"{NDVI_ZARR_PATH}/zarr.json"):
-        ndvi_store = s3fs.S3Map(root=NDVI_ZARR_PATH, s3=fs, check=False)
-        ndvi = xr.open_zarr(ndvi_store)
-        print(f"Last date in {NDVI_ZARR_PATH}: {ndvi.time.values[-1]}")
+    sequences = np.ascontiguousarray(compact(lookback, index).T, dtype=np.float32)
+    if len(models) > 1 and len(sequences) > 0:
+        sample = sequences[:: max(1, len(sequences) // BENCHMARK_SIZE)]
+        backend, model = select_backend(
+            models, forecast_pixels, sample, INFERENCE_BACKEND
+        )
     else:
-        raise FileNotFoundError(f"{NDVI_ZARR_PATH} was not found.")
+        backend, model = next(iter(models.items()))
+    print(f"Using the {backend} backend.")
 
-    pred_zarr_exists = False
-    if fs.exists(f"{PRED_ZARR_PATH}/zarr.json"):
-        pred_store = s3fs.S3Map(root=PRED_ZARR_PATH, s3=fs, check=False)
-        pred_zarr_exists = True
-    else:
-        print(f"{PRED_ZARR_PATH} was not found, creating new store.")
-        pred_store = s3fs.S3Map(root=PRED_ZARR_PATH, s3=fs, check=False)
-
-    s3 = boto3.client("s3")
-    try:
-        s3.download_file(BUCKET_NAME, MODEL_KEY, MODEL_LOCAL_PATH)
-        print("Model file download succeeded.")
-    except ClientError as e:
-        error_code = e.response["Error"]["Code"]
-        if error_code == "404" or error_code == "NoSuchKey":
-            print(f"File not found: s3://{BUCKET_NAME}/{MODEL_KEY}")
-        else:
-            print(f"Failed to download file: {e}")
-            raise
+    start = time.perf_counter()
+    result = forecast_pixels(model, sequences)
+    seconds = time.perf_counter() - start
+    print(
+        f"Forecast {len(index)} pixels in {seconds:.1f} s "
+        f"({len(index) / seconds:.0f} pixels/s, {torch.get_num_threads()} threads)."
+    )
+    return xr.DataArray(
+        scatter(result.T, index, (lookback.sizes["y"], lookback.sizes["x"])),
+        dims=("forecast_time", "y", "x"),
+        coords=lookback.isel(time=0, drop=True).coords,
+    )
 
-    client.run(load_model_on_worker, model_path=MODEL_LOCAL_PATH)
 
-    lookback = ndvi["ndvi_8d_processed"].isel(time=slice(-NUM_PAST_STEPS, None))
-    lookback = lookback.chunk({"x": 10, "y": 10, "time": NUM_PAST_STEPS})
-    print("Loaded lookback data.")
+def forecast_dask(lookback, valid, model_path):
+    """Forecast the valid pixels of the lookback in small dask tasks, others are NaN.
 
+    The execution is chosen from the number of pixels, see vhm_common.execution.
+    """
+    chunks = {"x": DASK_CHUNK_SIZE, "y": DASK_CHUNK_SIZE}
+    lookback = lookback.chunk({**chunks, "time": NUM_PAST_STEPS})
     forecast_da = xr.apply_ufunc(
         forecast,
         lookback,
-        input_core_dims=[["time"]],
+        valid.chunk(chunks),
+        kwargs={"model_path": model_path},
+        input_core_dims=[["time"], []],
         output_core_dims=[["forecast_time"]],
         output_sizes={"forecast_time": NUM_FUTURE_STEPS},
         output_dtypes=[np.float32],
         dask="parallelized",
     )
-    forecast_da = forecast_da.rename("ndvi_8d_forecast")
-    forecast_da = forecast_da.rename({"forecast_time": "time"}).transpose(
-        "time", "y", "x"
-    )
-    last_date = ndvi.time.values[-1]
+    with dask_execution(int(valid.sum()) * NUM_PAST_STEPS), ProgressBar():
+        return forecast_da.compute()
+
+
+def file_digest(path):
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def block_fingerprints(lookback, valid, block_size=FINGERPRINT_BLOCK_SIZE):
+    """Hash of the lookback values and valid mask of each block_size x block_size block.
+
+    Only the values are hashed, not the dates, so a block whose filled values did not
+    change has the same fingerprint after the lookback moves forward.
+    """
+    values = lookback.transpose("time", "y", "x").values.astype(np.float32)
+    mask = valid.transpose("y", "x").values
+    fingerprints = {}
+    for y in range(0, mask.shape[0], block_size):
+        for x in range(0, mask.shape[1], block_size):
+            block = (slice(y, y + block_size), slice(x, x + block_size))
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(np.ascontiguousarray(values[:, *block]).tobytes())
+            digest.update(np.ascontiguousarray(mask[block]).tobytes())
+            fingerprints[f"{y}_{x}"] = digest.hexdigest()
+    return fingerprints
+
+
+def changed_pixels(fingerprints, previous, valid, block_size=FINGERPRINT_BLOCK_SIZE):
+    """Valid pixels in the blocks whose fingerprint differs from the previous run."""
+    valid = valid.transpose("y", "x")
+    changed = np.zeros(valid.shape, dtype=bool)
+    for key, fingerprint in fingerprints.items():
+        if previous.get(key) != fingerprint:
+            y, x = map(int, key.split("_"))
+            changed[y : y + block_size, x : x + block_size] = True
+    return valid.copy(data=valid.values & changed)
+
+
+def load_previous_forecast(storage, pred_store, model_id):
+    """Block fingerprints and forecast of the previous run, or None if they can't be reused."""
+    if not storage.exists(FINGERPRINT_PATH):
+        return None
+    with storage.open(FINGERPRINT_PATH) as file:
+        previous = json.load(file)
+    if previous["model"] != model_id:
+        print("Model changed since the previous run.")
+        return None
+    preds = xr.open_zarr(pred_store)["ndvi_8d_forecast"]
+    dates = np.array(previous["forecast_dates"], dtype="datetime64[ns]")
+    if not np.isin(dates, preds.time.values).all():
+        return None
+    return previous["blocks"], preds.sel(time=dates).transpose("time", "y", "x").values
+
+
+def save_fingerprints(storage, model_id, forecast_dates, fingerprints):
+    with storage.open(FINGERPRINT_PATH, "w") as file:
+        json.dump(
+            {
+                "model": model_id,
+                "forecast_dates": [str(date) for date in forecast_dates],
+                "blocks": fingerprints,
+            },
+            file,
+        )
+
+
+def update_zarr_store(store, data):
+    updated, added = upsert(store, data)
+    print(f"Dates updated: {updated}")
+    print(f"Dates added: {added}")
+
+
+def run(storage, report, lookback=None):
+    """Forecast the pixels and add the forecast to the store, returns the forecast.
+
+    lookback is the last NUM_PAST_STEPS windows of processed NDVI if they are already in
+    memory, e.g. in the fused pipeline, otherwise they are read from the store.
+    """
+    if lookback is None:
+        if storage.zarr_exists(NDVI_ZARR_PATH):
+            ndvi_store = storage.zarr_store(NDVI_ZARR_PATH)
+            ndvi = xr.open_zarr(ndvi_store)
+        else:
+            raise FileNotFoundError(f"{storage.path(NDVI_ZARR_PATH)} was not found.")
+        lookback = ndvi["ndvi_8d_processed"].isel(time=slice(-NUM_PAST_STEPS, None))
+    print(f"Last date in {NDVI_ZARR_PATH}: {lookback.time.values[-1]}")
+
+    pred_zarr_exists = False
+    if storage.zarr_exists(PRED_ZARR_PATH):
+        pred_store = storage.zarr_store(PRED_ZARR_PATH)
+        pred_zarr_exists = True
+    else:
+        print(f"{PRED_ZARR_PATH} was not found, creating new store.")
+        pred_store = storage.zarr_store(PRED_ZARR_PATH)
+
+    with report.phase("load"):
+        try:
+            storage.download(MODEL_KEY, MODEL_LOCAL_PATH)
+            print("Model file download succeeded.")
+        except FileNotFoundError:
+            print(f"File not found: {storage.path(MODEL_KEY)}")
+            raise
+
+        lookback = lookback.load()
+        print("Loaded lookback data.")
+
+    with report.phase("valid_mask"):
+        valid = load_valid_mask(storage, lookback)
+        if valid is None:
+            print("Valid pixel mask was not found or is outdated, building it.")
+            valid = update_valid_mask(storage)
+
+    with report.phase("forecast"):
+        model_id = (
+            f"{file_digest(MODEL_LOCAL_PATH)}:{INFERENCE_MODE}:{INFERENCE_BACKEND}"
+        )
+        fingerprints = block_fingerprints(lookback, valid)
+        previous = None
+        if INCREMENTAL and pred_zarr_exists:
+            previous = load_previous_forecast(storage, pred_store, model_id)
+        if previous is None:
+            changed = valid
+        else:
+            changed = changed_pixels(fingerprints, previous[0], valid)
+        print(
+            f"Forecasting {float(changed.mean()):.1%} of pixels, "
+            f"{float(valid.mean()):.1%} are valid."
+        )
+        report.metrics.update(
+            pixels=int(valid.size),
+            valid_pixels=int(valid.sum()),
+            forecast_pixels=int(changed.sum()),
+        )
+
+        print(f"Computing forecast ({INFERENCE_MODE})...")
+        if INFERENCE_MODE == "batch":
+            models = {}
+            # The models aren't loaded if no pixel changed
+            if changed.any():
+                reference = load_torchscript(MODEL_LOCAL_PATH)
+                names = BACKENDS if INFERENCE_BACKEND == "auto" else [INFERENCE_BACKEND]
+                models = load_backends(
+                    names,
+                    storage,
+                    MODEL_KEY,
+                    reference,
+                    NUM_PAST_STEPS,
+                    required=INFERENCE_BACKEND != "auto",
+                )
+            forecast_da = forecast_batched(lookback, changed, models)
+        elif INFERENCE_MODE == "dask":
+            forecast_da = forecast_dask(lookback, changed, MODEL_LOCAL_PATH)
+        else:
+            raise ValueError(f"Unknown INFERENCE_MODE: {INFERENCE_MODE}")
+        forecast_da = forecast_da.rename("ndvi_8d_forecast")
+        forecast_da = forecast_da.rename({"forecast_time": "time"}).transpose(
+            "time", "y", "x"
+        )
+        if previous is not None:
+            # The forecast only depends on the lookback values, so unchanged blocks reuse
+            # the previous forecast at the new dates
+            forecast_da = forecast_da.copy(
+                data=np.where(changed.values, forecast_da.values, previous[1])
+            )
+    last_date = lookback.time.values[-1]
     forecast_dates = pd.date_range(
         start=last_date, periods=NUM_FUTURE_STEPS + 1, freq="8D"
     )[1:]
     forecast_da = forecast_da.assign_coords(time=forecast_dates)
-
-    print("Computing forecast...")
-    with ProgressBar():
-        forecast_da = forecast_da.compute()
     print(f"Predicted NDVI for {NUM_FUTURE_STEPS} steps ahead.")
 
-    if pred_zarr_exists:
-        update_zarr_store(pred_store, forecast_da)
-    else:
-        forecast_da.to_zarr(pred_store, mode="w", consolidated=True)
-        print(f"Dates added: {forecast_da['time'].values}")
-    print("Finished adding predictions to zarr store.")
+    with report.phase("write"):
+        # The fingerprints are only valid once the forecast they describe is written
+        storage.remove(FINGERPRINT_PATH)
+        if pred_zarr_exists:
+            update_zarr_store(pred_store, forecast_da)
+        else:
+            forecast_da.to_zarr(
+                pred_store,
+                mode="w",
+                encoding={forecast_da.name: ndvi_encoding(forecast_da)},
+                consolidated=True,
+            )
+            print(f"Dates added: {forecast_da['time'].values}")
+        save_fingerprints(storage, model_id, forecast_dates, fingerprints)
+        print("Finished adding predictions to zarr store.")
+    with report.phase("mirror"):
+        update_mirror(storage, PRED_ZARR_PATH, MIRRORS[PRED_ZARR_PATH])
+    return forecast_da
+
+
+def main():
+    if not MODEL_KEY:
+        raise ValueError("MODEL_KEY must be set to the key of the model.")
+    storage = storage_from_env()
+    print(storage)
+    with run_report("inference", storage) as report:
+        run(storage, report)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+import torch
+
+from backends import (
+    OnnxModel,
+    export_onnx,
+    load_backends,
+    quantize_onnx,
+    select_backend,
+)
+from inference_pipeline import NUM_FUTURE_STEPS, forecast_pixels
+
+
+class PersistenceModel(torch.nn.Module):
+    def __init__(self, scale=1.0):
+        super().__init__()
+        self.scale = scale
+
+    def forward(self, past_steps):
+        return past_steps[:, -NUM_FUTURE_STEPS:, :] * self.scale
+
+
+def traced(model):
+    return torch.jit.trace(model, torch.randn(1, 10, 1))
+
+
+@pytest.fixture
+def sample():
+    return np.random.default_rng(0).random((512, 10), dtype=np.float32)
+
+
+def test_select_backend_checks_parity(sample):
+    models = {
+        "torchscript": traced(PersistenceModel()),
+        "onnx": traced(PersistenceModel(scale=2.0)),
+    }
+
+    name, _ = select_backend(models, forecast_pixels, sample, preferred="onnx")
+
+    assert name == "torchscript"
+
+
+def test_onnx_backends_match_torchscript(sample, tmp_path):
+    pytest.importorskip("onnxruntime")
+    reference = traced(PersistenceModel())
+    path = str(tmp_path / "model.onnx")
+    export_onnx(reference, path, num_steps=10)
+    quantize_onnx(path, str(tmp_path / "model_int8.onnx"))
+    models = {
+        "torchscript": reference,
+        "onnx": OnnxModel(path),
+        "onnx-int8": OnnxModel(str(tmp_path / "model_int8.onnx")),
+    }
+
+    name, _ = select_backend(models, forecast_pixels, sample, preferred="onnx")
+
+    assert name == "onnx"
+    np.testing.assert_allclose(
+        forecast_pixels(models["onnx"], sample),
+        forecast_pixels(reference, sample),
+        atol=1e-5,
+    )
+
+
+class MissingStorage:
+    def download(self, key, path):
+        raise FileNotFoundError(key)
+
+
+def test_load_backends_raises_for_a_required_backend(tmp_path):
+    reference = traced(PersistenceModel())
+    args = (MissingStorage(), "model.pt", reference, 10, str(tmp_path))
+
+    models = load_backends(["torchscript-int8"], *args, required=False)
+    assert list(models) == ["torchscript"]
+    with pytest.raises(FileNotFoundError):
+        load_backends(["torchscript-int8"], *args)
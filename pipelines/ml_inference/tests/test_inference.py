@@ -1,9 +1,23 @@
 import numpy as np
 import pandas as pd
 import pytest
+import torch
 import xarray as xr
+from vhm_common.encoding import ndvi_encoding
+from vhm_common.upsert import upsert
 
-from inference_pipeline import update_zarr_store
+from inference_pipeline import (
+    NUM_FUTURE_STEPS,
+    block_fingerprints,
+    changed_pixels,
+    forecast_pixels,
+    update_zarr_store,
+)
+
+
+class PersistenceModel(torch.nn.Module):
+    def forward(self, past_steps):
+        return past_steps[:, -NUM_FUTURE_STEPS:, :] * 0.5
 
 
 @pytest.fixture
@@ -45,6 +59,10 @@ def test_overlap_dates(initialized_store):
 
     update_zarr_store(store, new_data)
 
+    ds = xr.open_zarr(store)
+    assert list(ds.time.values) == list(pd.to_datetime(["2020-01-01", *t]))
+    xr.testing.assert_equal(ds["data_var"].sel(time=t), new_data)
+
 
 def test_non_overlap_dates(initialized_store):
     store = initialized_store
@@ -56,3 +74,73 @@ def test_non_overlap_dates(initialized_store):
     new_data = xr.DataArray(data, coords={"y": y, "x": x, "time": t})
 
     update_zarr_store(store, new_data)
+
+    ds = xr.open_zarr(store)
+    assert ds.sizes["time"] == 5
+    xr.testing.assert_equal(ds["data_var"].sel(time=t), new_data)
+
+
+def test_upsert_sharded_store(tmp_path):
+    store = tmp_path / "forecast.zarr"
+    t = pd.date_range("2020-01-01", periods=5, freq="8D")
+    da = xr.DataArray(
+        np.random.rand(5, 4, 4).astype(np.float32),
+        coords={"time": t, "y": np.arange(4), "x": np.arange(4)},
+        name="ndvi_8d_forecast",
+    )
+    layout = {"chunks": {"time": 2, "y": 2, "x": 2}, "chunks_per_shard": {"y": 2}}
+    da.to_zarr(store, mode="w", encoding={da.name: ndvi_encoding(da, **layout)})
+
+    # Starts in the middle of a chunk along time and appends to the last one
+    t = pd.date_range("2020-01-25", periods=4, freq="8D")
+    new = da.isel(time=[0, 1, 2, 3]).assign_coords(time=t).chunk() * 0.5
+    updated, added = upsert(store, new)
+
+    assert list(updated) == list(t[:2])
+    assert list(added) == list(t[2:])
+    ds = xr.open_zarr(store)
+    assert ds["time"].size == 7
+    np.testing.assert_allclose(ds[da.name].values[:3], da.values[:3], atol=1e-4)
+    np.testing.assert_allclose(ds[da.name].sel(time=t).values, new.values, atol=1e-4)
+
+    with pytest.raises(ValueError):
+        upsert(store, new.isel(time=[0, 2]))
+    with pytest.raises(ValueError):
+        upsert(store, new.assign_coords(time=t - pd.Timedelta("4D")))
+
+
+def test_forecast_pixels_batches():
+    model = torch.jit.trace(PersistenceModel(), torch.randn(1, 10, 1))
+    sequences = np.random.default_rng(0).random((1000, 10), dtype=np.float32)
+
+    result = forecast_pixels(model, sequences, batch_size=64)
+
+    past_steps = torch.from_numpy(sequences[..., np.newaxis])
+    mean = past_steps.mean(dim=1, keepdim=True)
+    std = past_steps.std(dim=1, keepdim=True)
+    output = model((past_steps - mean) / (std + 1e-12))
+    expected = (output * std + mean).squeeze(-1).numpy()
+    assert result.shape == (1000, NUM_FUTURE_STEPS)
+    np.testing.assert_allclose(result, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_changed_pixels():
+    lookback = xr.DataArray(np.random.rand(5, 4, 6), dims=("time", "y", "x"))
+    valid = xr.DataArray(np.ones((4, 6), dtype=bool), dims=("y", "x"))
+    valid[0, 0] = False
+    previous = block_fingerprints(lookback, valid, block_size=2)
+
+    # Only the block with the changed pixel gets a new fingerprint
+    lookback = lookback.copy()
+    lookback[-1, 3, 5] = 0.0
+    fingerprints = block_fingerprints(lookback, valid, block_size=2)
+    assert [key for key in fingerprints if fingerprints[key] != previous[key]] == [
+        "2_4"
+    ]
+
+    changed = changed_pixels(fingerprints, previous, valid, block_size=2)
+    assert changed.values.sum() == 4
+    assert changed.values[2:, 4:].all()
+
+    changed = changed_pixels(fingerprints, {}, valid, block_size=2)
+    np.testing.assert_array_equal(changed.values, valid.values)
@@ -1,34 +1,106 @@
 import os
+from pathlib import Path
 
 import boto3
 import leafmap.foliumap as leafmap
+import rioxarray  # noqa: F401
 import streamlit as st
 from dotenv import load_dotenv
+from rasterio.warp import transform, transform_geom
+from streamlit_folium import st_folium
+from vhm_common.storage import Storage
+from vhm_common.timeseries import open_timeseries, pixel_series, polygon_series
+
+from tile_server import Layer, start_tile_server
 
 load_dotenv()
 BUCKET_NAME = os.environ["S3_BUCKET"]
+COG_KEYS = {
+    "Recent Trend": "COG/ndvi_recent_trend.tif",
+    "Forecast Trend": "COG/ndvi_forecast_trend.tif",
+}
+TREND_COLORMAP = {
+    "0": "#8b6f47",
+    "1": "#a9a9a9",
+    "2": "#45e640",
+    "3": "#dc4133",
+    "4": "#ffd700",
+    "5": "#ffffff",
+}
+# A TiTiler instance renders the tiles from presigned URLs. With TILE_SERVER_URL set,
+# tiles are rendered by a tile server in this process instead, and TILE_SERVER_URL is
+# where the browser reaches it, e.g. http://<host>:8765 or the URL of a proxy.
+TILER_ENDPOINT = os.environ.get("TILER_ENDPOINT", "https://titiler.opengeos.org")
+TILE_SERVER_URL = os.environ.get("TILE_SERVER_URL")
+TILE_SERVER_HOST = os.environ.get("TILE_SERVER_HOST", "0.0.0.0")
+TILE_SERVER_PORT = int(os.environ.get("TILE_SERVER_PORT", 8765))
+PRESIGNED_URL_EXPIRES = 1200
+# How long the time series stay open, so new pipeline runs show up in the charts
+TIMESERIES_TTL = int(os.environ.get("TIMESERIES_TTL", 3600))
+
+
+@st.cache_resource
+def s3_client():
+    return boto3.client(
+        "s3",
+        aws_access_key_id=st.secrets["aws_access_key_id"],
+        aws_secret_access_key=st.secrets["aws_secret_access_key"],
+        region_name=st.secrets["aws_region"],
+    )
+
+
+# Cached for less than the expiry, so a cached URL is always valid for a while
+@st.cache_data(ttl=PRESIGNED_URL_EXPIRES // 2)
+def generate_presigned_url(bucket, key):
+    return s3_client().generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": bucket,
+            "Key": key,
+        },
+        ExpiresIn=PRESIGNED_URL_EXPIRES,
+    )
+
+
+@st.cache_resource
+def tile_server():
+    """Tile server shared by all sessions, its tiles are cached until a COG changes."""
+    gdal_credentials = {
+        "AWS_ACCESS_KEY_ID": st.secrets["aws_access_key_id"],
+        "AWS_SECRET_ACCESS_KEY": st.secrets["aws_secret_access_key"],
+        "AWS_REGION": st.secrets["aws_region"],
+    }
+
+    def locator(key):
+        def locate():
+            etag = s3_client().head_object(Bucket=BUCKET_NAME, Key=key)["ETag"]
+            return f"/vsis3/{BUCKET_NAME}/{key}", etag
+
+        return locate
+
+    layers = {
+        Path(key).stem: Layer(locator(key), TREND_COLORMAP, gdal_credentials)
+        for key in COG_KEYS.values()
+    }
+    return start_tile_server(layers, host=TILE_SERVER_HOST, port=TILE_SERVER_PORT)
+
+
+@st.cache_resource(ttl=TIMESERIES_TTL)
+def load_timeseries():
+    """NDVI and forecast history, opened once and shared between sessions."""
+    storage = Storage(
+        f"s3://{BUCKET_NAME}",
+        key=st.secrets["aws_access_key_id"],
+        secret=st.secrets["aws_secret_access_key"],
+        client_kwargs={"region_name": st.secrets["aws_region"]},
+    )
+    return open_timeseries(storage)
 
 
 class VegetationHealthMonitor:
     def __init__(self):
         st.set_page_config(layout="wide", page_title="Vegetation Health Monitor")
 
-    def generate_presigned_url(self, bucket, key):
-        s3_client = boto3.client(
-            "s3",
-            aws_access_key_id=st.secrets["aws_access_key_id"],
-            aws_secret_access_key=st.secrets["aws_secret_access_key"],
-            region_name=st.secrets["aws_region"],
-        )
-        return s3_client.generate_presigned_url(
-            "get_object",
-            Params={
-                "Bucket": bucket,
-                "Key": key,
-            },
-            ExpiresIn=1200,
-        )
-
     def display(self):
         st.title("Vegetation Health Monitor")
         st.write(
@@ -40,41 +112,29 @@ class VegetationHealthMonitor:
             """
         )
 
-        recent_trend_url = self.generate_presigned_url(
-            BUCKET_NAME, "COG/ndvi_recent_trend.tif"
-        )
-        forecast_trend_url = self.generate_presigned_url(
-            BUCKET_NAME, "COG/ndvi_forecast_trend.tif"
-        )
-
         m = leafmap.Map(
             center=[13.541243890565807, -2.430867732749294],
             zoom=10,
-            draw_control=False,
+            draw_control=True,
             search_control=False,
         )
         m.add_basemap("HYBRID")
-        custom_cmap = {
-            "0": "#8b6f47",
-            "1": "#a9a9a9",
-            "2": "#45e640",
-            "3": "#dc4133",
-            "4": "#ffd700",
-            "5": "#ffffff",
-        }
-        titiler_endpoint = "https://titiler.opengeos.org"
-        m.add_cog_layer(
-            url=recent_trend_url,
-            colormap=custom_cmap,
-            name="Recent Trend",
-            titiler_endpoint=titiler_endpoint,
-        )
-        m.add_cog_layer(
-            url=forecast_trend_url,
-            colormap=custom_cmap,
-            name="Forecast Trend",
-            titiler_endpoint=titiler_endpoint,
-        )
+        if TILE_SERVER_URL is not None:
+            tile_server()
+        for name, key in COG_KEYS.items():
+            if TILE_SERVER_URL is not None:
+                m.add_tile_layer(
+                    url=f"{TILE_SERVER_URL}/{Path(key).stem}/{{z}}/{{x}}/{{y}}.png",
+                    name=name,
+                    attribution="Landsat",
+                )
+            else:
+                m.add_cog_layer(
+                    url=generate_presigned_url(BUCKET_NAME, key),
+                    colormap=TREND_COLORMAP,
+                    name=name,
+                    titiler_endpoint=TILER_ENDPOINT,
+                )
         m.add_legend(
             title="Vegetation Growth Trend",
             labels=[
@@ -85,9 +145,15 @@ class VegetationHealthMonitor:
                 "Peak Growth",
                 "Insufficient Data",
             ],
-            colors=[c for c in custom_cmap.values()],
+            colors=list(TREND_COLORMAP.values()),
+        )
+        map_state = st_folium(
+            m,
+            height=600,
+            use_container_width=True,
+            returned_objects=["last_clicked", "last_active_drawing"],
         )
-        m.to_streamlit(height=600)
+        self.display_history(map_state)
 
         with st.sidebar:
             st.title("About the data")
@@ -102,6 +168,28 @@ class VegetationHealthMonitor:
                 """
             )
 
+    def display_history(self, map_state):
+        drawing = map_state.get("last_active_drawing")
+        clicked = map_state.get("last_clicked")
+        if not drawing and not clicked:
+            st.info(
+                "Click the map or draw a polygon to see the NDVI history and forecast."
+            )
+            return
+
+        ts = load_timeseries()
+        if drawing and drawing["geometry"]["type"] == "Polygon":
+            geometry = transform_geom("EPSG:4326", ts.rio.crs, drawing["geometry"])
+            history = polygon_series(ts, geometry)
+            st.subheader("Mean NDVI in the drawn area")
+        else:
+            xs, ys = transform(
+                "EPSG:4326", ts.rio.crs, [clicked["lng"]], [clicked["lat"]]
+            )
+            history = pixel_series(ts, xs[0], ys[0])
+            st.subheader(f"NDVI at {clicked['lat']:.4f}, {clicked['lng']:.4f}")
+        st.line_chart(history)
+
 
 if __name__ == "__main__":
     app = VegetationHealthMonitor()
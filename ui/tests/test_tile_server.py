@@ -0,0 +1,110 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+import rasterio
+from PIL import Image
+from rasterio.transform import from_origin
+
+import tile_server
+from tile_server import (
+    TILE_SIZE,
+    WEB_MERCATOR_EXTENT,
+    Layer,
+    TileCache,
+    TileServer,
+    colormap_lut,
+    tile_transform,
+)
+
+COLORMAP = {0: "#ff0000", 1: "#00ff00"}
+
+
+def write_classes(path, value):
+    # One class over a small area around the origin in Web Mercator
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=100,
+        height=100,
+        count=1,
+        dtype="int8",
+        crs="EPSG:3857",
+        transform=from_origin(-5e4, 5e4, 1000, 1000),
+        nodata=-1,
+    ) as dst:
+        dst.write(np.full((1, 100, 100), value, dtype=np.int8))
+
+
+def tile_pixels(tile):
+    return np.asarray(Image.open(BytesIO(tile)))
+
+
+def test_tile_transform_bounds():
+    half = WEB_MERCATOR_EXTENT / 2
+    transform = tile_transform(0, 0, 0)
+    assert transform * (0, 0) == pytest.approx((-half, half))
+    assert transform * (TILE_SIZE, TILE_SIZE) == pytest.approx((half, -half))
+
+    # Tile 1/1/0 is the north-east quarter
+    transform = tile_transform(1, 1, 0)
+    assert transform * (0, 0) == pytest.approx((0, half))
+    assert transform * (TILE_SIZE, TILE_SIZE) == pytest.approx((half, 0), abs=1e-6)
+    assert transform.a == pytest.approx(half / TILE_SIZE)
+
+
+def test_colormap_lut():
+    lut = colormap_lut({0: "#ff0000", "2": "0080ff"})
+
+    assert lut.shape == (256, 4)
+    assert lut.dtype == np.uint8
+    np.testing.assert_array_equal(lut[0], [0, 0, 0, 0])
+    np.testing.assert_array_equal(lut[1], [255, 0, 0, 255])
+    np.testing.assert_array_equal(lut[2], [0, 0, 0, 0])
+    np.testing.assert_array_equal(lut[3], [0, 128, 255, 255])
+
+
+def test_tile_cache_evicts_least_recently_used():
+    cache = TileCache(max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"
+
+    # Over the limit, b was used least recently
+    cache.put("c", b"1234")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234"
+    assert cache.get("c") == b"1234"
+    assert cache.nbytes == 8
+    assert (cache.hits, cache.misses) == (3, 1)
+
+    cache.put("d", b"12345678")
+    assert list(cache.tiles) == ["d"]
+    assert cache.nbytes == 8
+
+
+def test_new_version_invalidates_tiles(tmp_path, monkeypatch):
+    monkeypatch.setattr(tile_server, "VERSION_TTL", -1)
+    path = str(tmp_path / "classes.tif")
+    write_classes(path, 0)
+    version = {"etag": "v1"}
+    layer = Layer(lambda: (path, version["etag"]), COLORMAP)
+    server = TileServer(("127.0.0.1", 0), {"classes": layer})
+    try:
+        tile = server.tile("classes", 8, 128, 127)
+        pixels = tile_pixels(tile)
+        np.testing.assert_array_equal(pixels[-1, 0], [255, 0, 0, 255])
+        np.testing.assert_array_equal(pixels[0, 0], [0, 0, 0, 0])
+        assert server.tile("classes", 8, 128, 127) is tile
+        assert server.cache.hits == 1
+
+        # The same version is served from the cache even if the file changed
+        write_classes(path, 1)
+        assert server.tile("classes", 8, 128, 127) is tile
+
+        version["etag"] = "v2"
+        pixels = tile_pixels(server.tile("classes", 8, 128, 127))
+        np.testing.assert_array_equal(pixels[-1, 0], [0, 255, 0, 255])
+    finally:
+        server.server_close()
@@ -0,0 +1,186 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import numpy as np
+import rasterio
+from affine import Affine
+from PIL import Image
+from rasterio.enums import Resampling
+from rasterio.warp import reproject
+
+TILE_SIZE = 256
+# Rendered PNG tiles kept in memory, least recently used tiles are dropped first
+TILE_CACHE_BYTES = int(os.environ.get("TILE_CACHE_BYTES", 64 * 2**20))
+# How often the version of a COG is checked, a new version invalidates its tiles
+VERSION_TTL = float(os.environ.get("TILE_VERSION_TTL", 60))
+GDAL_OPTIONS = {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "VSI_CACHE": "TRUE",
+}
+WEB_MERCATOR_EXTENT = 2 * math.pi * 6378137
+
+
+def tile_transform(z, x, y, size=TILE_SIZE):
+    """Transform of XYZ tile z/x/y in Web Mercator."""
+    tile_extent = WEB_MERCATOR_EXTENT / 2**z
+    left = -WEB_MERCATOR_EXTENT / 2 + x * tile_extent
+    top = WEB_MERCATOR_EXTENT / 2 - y * tile_extent
+    return Affine.translation(left, top) * Affine.scale(
+        tile_extent / size, -tile_extent / size
+    )
+
+
+def colormap_lut(colormap):
+    """RGBA lookup table indexed by class + 1, index 0 is transparent for nodata."""
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    for value, color in colormap.items():
+        color = color.lstrip("#")
+        lut[int(value) + 1] = [*(int(color[i : i + 2], 16) for i in (0, 2, 4)), 255]
+    return lut
+
+
+class TileCache:
+    """LRU cache of rendered tiles bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes=TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.tiles = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.tiles.move_to_end(key)
+            return tile
+
+    def put(self, key, tile):
+        with self.lock:
+            if key in self.tiles:
+                return
+            self.tiles[key] = tile
+            self.nbytes += len(tile)
+            while self.nbytes > self.max_bytes:
+                _, dropped = self.tiles.popitem(last=False)
+                self.nbytes -= len(dropped)
+
+
+class Layer:
+    """A class COG rendered as XYZ tiles.
+
+    locate returns the GDAL path of the COG and its version, e.g. the S3 ETag. Datasets
+    are opened once per version and overview level and read with range requests. GDAL
+    datasets can't be shared between threads, so tiles of a layer are rendered one at
+    a time.
+    """
+
+    def __init__(self, locate, colormap, env_options=None):
+        self.locate = locate
+        self.lut = colormap_lut(colormap)
+        self.env_options = env_options or {}
+        self.lock = threading.RLock()
+        self.datasets = {}
+        self.path = None
+        self.version = None
+        self.checked = 0
+
+    def current_version(self):
+        with self.lock:
+            if time.monotonic() - self.checked > VERSION_TTL:
+                path, version = self.locate()
+                if version != self.version:
+                    for dataset in self.datasets.values():
+                        dataset.close()
+                    self.datasets = {}
+                    self.path, self.version = path, version
+                self.checked = time.monotonic()
+            return self.version
+
+    def dataset(self, resolution):
+        """The coarsest overview that is finer than resolution."""
+        with self.lock:
+            if None not in self.datasets:
+                self.datasets[None] = rasterio.open(self.path)
+            full = self.datasets[None]
+            level = None
+            for i, factor in enumerate(full.overviews(1)):
+                if full.res[0] * factor <= resolution:
+                    level = i
+            if level not in self.datasets:
+                self.datasets[level] = rasterio.open(self.path, overview_level=level)
+            return self.datasets[level]
+
+    def render(self, z, x, y):
+        transform = tile_transform(z, x, y)
+        classes = np.full((TILE_SIZE, TILE_SIZE), -1, dtype=np.int16)
+        with self.lock:
+            reproject(
+                source=rasterio.band(self.dataset(transform.a), 1),
+                destination=classes,
+                dst_transform=transform,
+                dst_crs="EPSG:3857",
+                dst_nodata=-1,
+                resampling=Resampling.nearest,
+            )
+        png = BytesIO()
+        Image.fromarray(self.lut[classes + 1], "RGBA").save(png, format="PNG")
+        return png.getvalue()
+
+
+class TileServer(ThreadingHTTPServer):
+    """Serves /<layer>/<z>/<x>/<y>.png tiles of the layers from a shared cache."""
+
+    daemon_threads = True
+
+    def __init__(self, address, layers, cache=None):
+        super().__init__(address, TileHandler)
+        self.layers = layers
+        self.cache = cache or TileCache()
+
+    def tile(self, name, z, x, y):
+        layer = self.layers[name]
+        key = (name, layer.current_version(), z, x, y)
+        tile = self.cache.get(key)
+        if tile is None:
+            with rasterio.Env(**GDAL_OPTIONS, **layer.env_options):
+                tile = layer.render(z, x, y)
+            self.cache.put(key, tile)
+        return tile
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        try:
+            name, z, x, y = self.path.strip("/").removesuffix(".png").split("/")
+            tile = self.server.tile(name, int(z), int(x), int(y))
+        except (KeyError, ValueError):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(tile)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(tile)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_tile_server(layers, host="127.0.0.1", port=0):
+    """Start a tile server in a background thread, port 0 picks a free port."""
+    server = TileServer((host, port), layers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server